@@ -5,6 +5,11 @@ from .io import *
 from .io_simsurvey import *
 from .aliases import *
 from .lightcurve import *
+from .features import *
+from .tensors import *
+from .gp import *
+from .memory import *
+from .sketches import *
 
 here = __file__
 basedir = os.path.split(here)[0]
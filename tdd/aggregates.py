@@ -0,0 +1,234 @@
+"""
+Mergeable partial aggregates for the summaries and coadds of photometry.
+Rather than final values, these hold the partial states of the aggregates
+(counts, sums, weighted sums, minima and maxima) for each group, which can be
+computed on arbitrary partitions of the photometry (shards, nodes, ranges of
+time), combined with the associative operation `merge`, and turned into the
+final values with `finalize`.
+"""
+from __future__ import absolute_import, print_function, division
+from functools import reduce
+import numpy as np
+import pandas as pd
+
+__all__ = ['AggregateState', 'SummaryState', 'CoaddState']
+
+
+class AggregateState(object):
+    """
+    Partial aggregates indexed by the grouping keys. Each column of `state`
+    is combined across partial states by the reduction given by the prefix
+    of its name: `count` and `sum_` by sums, `min_` and `order_` by minima
+    and `max_` by maxima. A column `first_<col>` holds the first non null
+    value of `<col>` in the photometry, and is combined by taking the value
+    with the smallest position `order_<col>` in the photometry.
+
+    Parameters
+    ----------
+    state : `pd.DataFrame`
+        partial aggregates indexed by the grouping keys
+    """
+    def __init__(self, state):
+        self.state = state
+
+    @property
+    def grouping(self):
+        return list(self.state.index.names)
+
+    @staticmethod
+    def _reduction(col):
+        if col.startswith('min_') or col.startswith('order_'):
+            return 'min'
+        elif col.startswith('first_'):
+            return 'first'
+        elif col.startswith('max_'):
+            return 'max'
+        return 'sum'
+
+    def merge(self, other):
+        """
+        return the partial aggregates of the union of the photometry of
+        `self` and `other`
+        """
+        if self.grouping != other.grouping:
+            raise ValueError('cannot merge states with different groupings',
+                             self.grouping, other.grouping)
+        state = pd.concat([self.state, other.state], sort=False)
+        aggdict = dict((col, self._reduction(col)) for col in state.columns)
+        merged = state.groupby(level=self.grouping, sort=True).agg(aggdict)
+        for col in state.columns:
+            if col.startswith('first_'):
+                orderCol = 'order_' + col[len('first_'):]
+                ordered = state[[orderCol, col]].sort_values(
+                    orderCol, kind='mergesort', na_position='last')
+                merged[col] = ordered.groupby(level=self.grouping,
+                                              sort=True)[col].first()
+        return self.__class__(merged[list(self.state.columns)])
+
+    @classmethod
+    def mergeAll(cls, states):
+        """
+        merge a sequence of partial states
+        """
+        return reduce(lambda x, y: x.merge(y), states)
+
+
+class SummaryState(AggregateState):
+    """
+    Partial aggregates for the default summary of `LightCurve.summarize`:
+    the maximum of `SNR`, extremes of `mjd` and the number of observations
+    for each (`snid`, `band`) among observations with `SNR` > `SNRmin`.
+    """
+    @classmethod
+    def fromFrame(cls, lcdf, SNRmin=-10000., grouping=('snid', 'band')):
+        """
+        partial aggregates of the photometry `lcdf`
+
+        Parameters
+        ----------
+        lcdf : `pd.DataFrame` or `PhotTables`
+            photometry with columns `snid`, `band`, `mjd`, `zp` and either
+            `SNR` or `flux` and `fluxerr`
+        SNRmin : float, defaults to -10000.
+            only observations with `SNR` > `SNRmin` are summarized
+        grouping : tuple of strings, defaults to ('snid', 'band')
+            grouping keys
+        """
+        lcdf = getattr(lcdf, 'lcs', lcdf)
+        if 'SNR' in lcdf.columns:
+            snr = lcdf['SNR'].values
+        else:
+            snr = lcdf['flux'].values / lcdf['fluxerr'].values
+        sel = snr > SNRmin
+        keys = list(lcdf[col].values[sel] for col in grouping)
+        df = pd.DataFrame(dict(max_SNR=snr[sel],
+                               max_mjd=lcdf['mjd'].values[sel],
+                               min_mjd=lcdf['mjd'].values[sel],
+                               count_zp=lcdf['zp'].notnull().values[sel]))
+        state = df.groupby(keys, sort=True).agg(dict(max_SNR='max',
+                                                    max_mjd='max',
+                                                    min_mjd='min',
+                                                    count_zp='sum'))
+        state.index.names = list(grouping)
+        return cls(state[['max_SNR', 'max_mjd', 'min_mjd', 'count_zp']])
+
+    def finalize(self, summary_prefix=''):
+        """
+        summary with the same values and column names as
+        `LightCurve.summarize` with its default arguments
+        """
+        state = self.state
+        summary = pd.concat([state.max_SNR, state.max_mjd, state.min_mjd,
+                             state.count_zp.astype(np.int64)], axis=1)
+        summary.columns = pd.MultiIndex.from_tuples([('SNR', 'max'),
+                                                     ('mjd', 'max'),
+                                                     ('mjd', 'min'),
+                                                     ('zp', 'count')])
+        if len(self.grouping) > 1:
+            summary = summary.unstack()
+        columns = list('_'.join(map(str, col)).strip()
+                       for col in summary.columns.values)
+        columns = list('NOBS' + col.split('count')[-1] if 'count' in col
+                       else col for col in columns)
+        summary.columns = list(summary_prefix + col for col in columns)
+        return summary
+
+
+class CoaddState(AggregateState):
+    """
+    Partial aggregates for the coadds of `PhotTables.coaddedTable`: the sums
+    of inverse variance weights, of weighted values of the averaged columns,
+    the number of exposures, and the first values of `zpsys` and of the
+    columns kept for each (`snid`, `band`, `night`).
+    """
+    @classmethod
+    def fromFrame(cls, lcdf, timeOffset=0., timeStep=1.0,
+                  avg_cols=('mjd', 'flux', 'zp'),
+                  additionalColsKept=('tileID', 'fieldID', 'zpsys'),
+                  rowOrder=None):
+        """
+        partial aggregates of the photometry `lcdf`
+
+        Parameters
+        ----------
+        lcdf : `pd.DataFrame` or `PhotTables`
+            photometry with columns `snid`, `band`, `mjd`, `fluxerr`,
+            `zpsys`, `avg_cols` and `additionalColsKept`
+        timeOffset : float, unit of days, defaults to 0.
+            offset used in discretization of time for coaddition
+        timeStep : float, units of days, defaults to 1.0
+            time period over which observations are coadded
+        avg_cols : tuple of strings, defaults to ('mjd', 'flux', 'zp')
+            columns whose inverse variance weighted averages are computed
+        additionalColsKept : tuple of strings, defaults to ('tileID',
+            'fieldID', 'zpsys')
+            columns whose first values are kept, as in
+            `PhotTables.coaddedTable`
+        rowOrder : `np.ndarray`, defaults to None
+            positions of the rows of `lcdf` in the whole photometry, which
+            define the first values. If None, the index of `lcdf`, which is
+            that of the whole photometry for partitions sliced from it.
+        """
+        lcdf = getattr(lcdf, 'lcs', lcdf)
+        if rowOrder is None:
+            rowOrder = lcdf.index.values
+        rowOrder = np.asarray(rowOrder, dtype=np.float64)
+        night = ((lcdf.mjd.values - timeOffset) // timeStep).astype(np.int64)
+        weights = 1.0 / lcdf.fluxerr.values**2
+        data = dict(sum_w=weights, count=np.ones(len(lcdf), dtype=np.int64))
+        firstCols = ['zpsys']
+        if additionalColsKept is not None:
+            firstCols += list(col for col in additionalColsKept
+                              if col not in firstCols)
+        for col in firstCols:
+            values = lcdf[col]
+            data['first_' + col] = values.values
+            data['order_' + col] = np.where(values.notnull().values,
+                                            rowOrder, np.nan)
+        for col in avg_cols:
+            data['sum_w' + col] = weights * lcdf[col].values
+        keys = [lcdf.snid.values, lcdf.band.values, night]
+        # the first values are those of the earliest rows
+        positions = np.argsort(rowOrder, kind='mergesort')
+        df = pd.DataFrame(data).iloc[positions]
+        keys = list(key[positions] for key in keys)
+        state = df.groupby(keys, sort=True).agg(
+            dict((col, AggregateState._reduction(col)) for col in data))
+        state.index.names = ['snid', 'band', 'night']
+        columns = list('first_' + col for col in firstCols) + \
+            list('order_' + col for col in firstCols) + ['count', 'sum_w'] + \
+            list('sum_w' + col for col in avg_cols)
+        return cls(state[columns])
+
+    def finalize(self, additionalColsKept=('tileID', 'fieldID', 'zpsys'),
+                 prepend_colNames='coadd_'):
+        """
+        coadded table with the columns `snid`, `band`, `night`, `zpsys`, the
+        columns `additionalColsKept`, `numExpinCoadd`, the averaged columns
+        and `fluxerr`, with the same values and column names as
+        `PhotTables.coaddedTable` with the same `additionalColsKept` and
+        `prepend_colNames` and first aggregates.
+        """
+        state = self.state
+        coadd = state[['first_zpsys']].copy()
+        coadd.columns = ['zpsys']
+        columns = ['night', 'zpsys']
+        for (i, col) in enumerate(additionalColsKept or ()):
+            coadd[i] = state['first_' + col].values
+            columns.append(col)
+        coadd['numExpinCoadd'] = state['count'].values
+        columns.append('numExpinCoadd')
+        for col in state.columns:
+            if col.startswith('sum_w') and col != 'sum_w':
+                coadd[col[len('sum_w'):]] = state[col].values \
+                    / state.sum_w.values
+                columns.append(col[len('sum_w'):])
+        coadd['fluxerr'] = 1.0 / np.sqrt(state.sum_w.values)
+        columns.append('fluxerr')
+        coadd = coadd.reset_index()
+        coadd.columns = ['snid', 'band'] + columns
+        if prepend_colNames is not None:
+            coadd.columns = list(col if col in ('snid', 'band')
+                                 else prepend_colNames + col
+                                 for col in coadd.columns)
+        return coadd
@@ -0,0 +1,149 @@
+"""
+Bounded memoization of the results of expensive methods of mutable
+containers like `PhotTables`. Results are keyed by the name of the method,
+the arguments of the call and a version counter of the instance, which
+must be incremented whenever the instance is modified.
+"""
+from __future__ import absolute_import, print_function, division
+from collections import OrderedDict
+import functools
+import inspect
+import sys
+import numpy as np
+import pandas as pd
+
+__all__ = ['LRUCache', 'cachedMethod']
+
+
+def _sizeof(obj):
+    """
+    approximate size of `obj` in bytes
+    """
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return int(np.sum(obj.memory_usage(index=True)))
+    elif isinstance(obj, np.ndarray):
+        return obj.nbytes
+    return sys.getsizeof(obj)
+
+
+class LRUCache(object):
+    """
+    Least recently used cache of bounded number of entries and total size
+
+    Parameters
+    ----------
+    maxEntries : int, defaults to 16
+        maximal number of entries stored
+    maxBytes : int, defaults to None
+        maximal total size of the entries in bytes. If None, the size is not
+        bounded. Values larger than `maxBytes` are not stored.
+    """
+    def __init__(self, maxEntries=16, maxBytes=None):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """
+        return a tuple (found, value) for `key`, where `value` is None if
+        `key` is not found
+        """
+        if key in self._entries:
+            value, size = self._entries.pop(key)
+            self._entries[key] = (value, size)
+            self.hits += 1
+            return True, value
+        self.misses += 1
+        return False, None
+
+    def put(self, key, value):
+        """
+        store `value` for `key`, evicting least recently used entries to
+        satisfy the bounds
+        """
+        size = _sizeof(value)
+        if key in self._entries:
+            self.nbytes -= self._entries.pop(key)[1]
+        if self.maxEntries < 1 or \
+                (self.maxBytes is not None and size > self.maxBytes):
+            return
+        self._entries[key] = (value, size)
+        self.nbytes += size
+        while len(self._entries) > self.maxEntries or \
+                (self.maxBytes is not None and self.nbytes > self.maxBytes):
+            _, (_, oldsize) = self._entries.popitem(last=False)
+            self.nbytes -= oldsize
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    @property
+    def stats(self):
+        """
+        dictionary of hits, misses, evictions, number of entries and total
+        size in bytes
+        """
+        return dict(hits=self.hits, misses=self.misses,
+                    evictions=self.evictions, entries=len(self._entries),
+                    nbytes=self.nbytes)
+
+
+def _hashable(value):
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+def cachedMethod(func):
+    """
+    decorator memoizing a method in the `LRUCache` found as the attribute
+    `cache` of the instance, keyed by the method name, the `version`
+    attribute of the instance and the values of all of the arguments. Calls
+    with unhashable arguments (eg. `pd.DataFrame`) are not cached.
+
+    .. note:: Cached results are returned without copies and must not be
+    modified.
+    """
+    try:
+        signature = inspect.signature(func)
+    except AttributeError:
+        signature = None
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        cache = getattr(self, 'cache', None)
+        if cache is None:
+            return func(self, *args, **kwargs)
+
+        if signature is not None:
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            callargs = dict(bound.arguments)
+        else:
+            callargs = inspect.getcallargs(func, self, *args, **kwargs)
+        callargs.pop('self', None)
+        key = (func.__name__, self.version,
+               tuple(sorted((k, _hashable(v)) for (k, v) in callargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            return func(self, *args, **kwargs)
+
+        found, value = cache.get(key)
+        if not found:
+            value = func(self, *args, **kwargs)
+            cache.put(key, value)
+        return value
+    return wrapper
@@ -0,0 +1,279 @@
+"""
+Vectorized extraction of light curve features from photometry tables for
+classification pipelines. Features are computed for each single band light
+curve, ie. the group of rows sharing the same (`snid`, `band`) values used by
+`PhotTables`, through segmented reductions on arrays sorted by
+(`snid`, `band`, `mjd`). The results are returned as a wide table with a row
+for each object.
+"""
+from __future__ import absolute_import, print_function, division
+from collections import OrderedDict
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+__all__ = ['SortedLightCurves', 'feature_registry', 'register_feature',
+           'extract_features']
+
+
+class SortedLightCurves(object):
+    """
+    Arrays of photometry sorted by (`snid`, `band`, `mjd`) along with the
+    boundaries of the single band light curves, so that quantities may be
+    computed for every light curve using `numpy.ufunc.reduceat`.
+
+    Parameters
+    ----------
+    snid : `np.ndarray`
+        object IDs
+    band : `np.ndarray`
+        bandpass names
+    mjd : `np.ndarray` of floats
+        times of observation
+    flux : `np.ndarray` of floats
+        flux of the observations
+    fluxerr : `np.ndarray` of floats
+        uncertainties of the flux
+    presorted : Bool, defaults to False
+        if True, the arrays are assumed to be sorted by (`snid`, `band`, `mjd`)
+    """
+    def __init__(self, snid, band, mjd, flux, fluxerr, presorted=False):
+
+        snid = np.asarray(snid)
+        band = np.asarray(band)
+        if not presorted:
+            bandcodes = pd.factorize(band, sort=True)[0]
+            order = np.lexsort((mjd, bandcodes, snid))
+            snid = snid[order]
+            band = band[order]
+            mjd = np.asarray(mjd)[order]
+            flux = np.asarray(flux)[order]
+            fluxerr = np.asarray(fluxerr)[order]
+
+        self.mjd = np.asarray(mjd, dtype=np.float64)
+        self.flux = np.asarray(flux, dtype=np.float64)
+        self.fluxerr = np.asarray(fluxerr, dtype=np.float64)
+
+        numRows = len(snid)
+        newGroup = np.ones(numRows, dtype=bool)
+        newGroup[1:] = (snid[1:] != snid[:-1]) | (band[1:] != band[:-1])
+        self.starts = np.flatnonzero(newGroup)
+        self.counts = np.diff(np.append(self.starts, numRows))
+        self.snid = snid[self.starts]
+        self.band = band[self.starts]
+
+    @property
+    def numGroups(self):
+        return len(self.starts)
+
+    def reduce(self, ufunc, values):
+        """
+        reduce `values` over each single band light curve with `ufunc`
+        (eg. `np.add`, `np.maximum`)
+        """
+        if len(values) == 0:
+            return np.zeros(0, dtype=np.asarray(values).dtype)
+        return ufunc.reduceat(values, self.starts)
+
+    def expand(self, groupValues):
+        """
+        broadcast an array of values for each light curve to the rows of the
+        light curve
+        """
+        return np.repeat(groupValues, self.counts)
+
+    def first(self, values):
+        return values[self.starts]
+
+    def last(self, values):
+        return values[self.starts + self.counts - 1]
+
+    def argmax(self, values):
+        """
+        row positions of the (first) maximum of `values` in each light curve
+        """
+        maxvals = self.expand(self.reduce(np.maximum, values))
+        positions = np.where(values == maxvals, np.arange(len(values)),
+                             len(values))
+        return self.reduce(np.minimum, positions)
+
+
+feature_registry = OrderedDict()
+
+
+def register_feature(name, registry=feature_registry):
+    """
+    decorator registering a function computing a feature for each single
+    band light curve. The function must accept an instance of
+    `SortedLightCurves` and return an array of length `numGroups`.
+    """
+    def decorator(func):
+        registry[name] = func
+        return func
+    return decorator
+
+
+@register_feature('nobs')
+def _nobs(slc):
+    return slc.counts.astype(np.float64)
+
+
+@register_feature('peakflux')
+def _peakflux(slc):
+    return slc.reduce(np.maximum, slc.flux)
+
+
+@register_feature('amplitude')
+def _amplitude(slc):
+    return slc.reduce(np.maximum, slc.flux) - slc.reduce(np.minimum, slc.flux)
+
+
+@register_feature('risetime')
+def _risetime(slc):
+    return slc.mjd[slc.argmax(slc.flux)] - slc.first(slc.mjd)
+
+
+@register_feature('declinetime')
+def _declinetime(slc):
+    return slc.last(slc.mjd) - slc.mjd[slc.argmax(slc.flux)]
+
+
+@register_feature('skew')
+def _skew(slc):
+    mean = slc.reduce(np.add, slc.flux) / slc.counts
+    dev = slc.flux - slc.expand(mean)
+    m2 = slc.reduce(np.add, dev**2) / slc.counts
+    m3 = slc.reduce(np.add, dev**3) / slc.counts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        skew = m3 / m2**1.5
+    skew[m2 <= 0.] = np.nan
+    return skew
+
+
+@register_feature('nnights')
+def _nnights(slc):
+    nights = np.floor(slc.mjd)
+    newNight = np.ones(len(nights), dtype=np.int64)
+    newNight[1:] = nights[1:] != nights[:-1]
+    newNight[slc.starts] = 1
+    return slc.reduce(np.add, newNight).astype(np.float64)
+
+
+def _featureChunk(args):
+    """
+    compute features for a chunk of photometry already sorted by
+    (`snid`, `band`, `mjd`) and holding complete objects
+    """
+    snid, band, mjd, flux, fluxerr, features = args
+    slc = SortedLightCurves(snid, band, mjd, flux, fluxerr, presorted=True)
+    vals = np.empty((slc.numGroups, len(features)), dtype=np.float64)
+    for i, func in enumerate(features.values()):
+        vals[:, i] = func(slc)
+    return slc.snid, slc.band, vals
+
+
+def extract_features(phot, features=None, bands=None, colors=True,
+                     objectsPerChunk=10000, nproc=1):
+    """
+    compute features for each single band light curve in a photometry table
+    and return them as a wide table with one row per object and columns
+    named `feature_band`.
+
+    Parameters
+    ----------
+    phot : `pd.DataFrame` or `PhotTables`
+        photometry with columns `snid`, `band`, `mjd`, `flux`, `fluxerr`
+    features : sequence of strings or dictionary, defaults to None
+        names of features in `feature_registry`, or a dictionary with names
+        as keys and functions as values. If None, all of the registered
+        features are computed. Functions must be picklable if `nproc` > 1.
+    bands : sequence of strings, defaults to None
+        bands and their order in the output. If None, all bands found in the
+        photometry sorted by name. The order should be that of wavelength for
+        the colors to be meaningful.
+    colors : Bool, defaults to True
+        if True, include the colors at peak, `-2.5 log10(peakflux_b1 /
+        peakflux_b2)`, for consecutive pairs of `bands` as columns named
+        `color_b1_b2`
+    objectsPerChunk : int, defaults to 10000
+        number of objects in each chunk of the computation
+    nproc : int, defaults to 1
+        number of processes over which the chunks are distributed
+
+    Returns
+    -------
+    `pd.DataFrame` indexed by `snid`
+    """
+    lcs = getattr(phot, 'lcs', phot)
+
+    if features is None:
+        features = feature_registry
+    if not isinstance(features, dict):
+        features = OrderedDict((name, feature_registry[name])
+                               for name in features)
+    else:
+        features = OrderedDict(features)
+    if colors and 'peakflux' not in features:
+        features['peakflux'] = feature_registry['peakflux']
+
+    # Sort once, and split into chunks of complete objects
+    snid = lcs['snid'].values
+    band = lcs['band'].values
+    bandnames, bandcodes = np.unique(band, return_inverse=True)
+    order = np.lexsort((lcs['mjd'].values, bandcodes, snid))
+    snid = snid[order]
+    arrays = (snid, band[order], lcs['mjd'].values[order],
+              lcs['flux'].values[order], lcs['fluxerr'].values[order])
+
+    chunks = []
+    if len(snid) > 0:
+        objstarts = np.flatnonzero(np.append(True, snid[1:] != snid[:-1]))
+        bounds = np.append(objstarts[::objectsPerChunk], len(snid))
+        chunks = list(tuple(arr[bounds[i]: bounds[i + 1]] for arr in arrays)
+                      + (features,) for i in range(len(bounds) - 1))
+
+    if nproc > 1 and len(chunks) > 1:
+        pool = multiprocessing.Pool(nproc)
+        try:
+            results = pool.map(_featureChunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = list(map(_featureChunk, chunks))
+
+    if len(results) > 0:
+        gsnid, gband, vals = (np.concatenate(x) for x in zip(*results))
+    else:
+        gsnid = snid[:0]
+        gband = band[:0]
+        vals = np.zeros((0, len(features)))
+
+    # Scatter into the wide matrix
+    if bands is None:
+        bands = bandnames
+    bands = list(bands)
+    bandIndex = pd.Index(bands).get_indexer(gband)
+    keep = bandIndex >= 0
+    objects, objIndex = np.unique(gsnid, return_inverse=True)
+
+    numBands = len(bands)
+    numFeatures = len(features)
+    wide = np.full((len(objects), numFeatures, numBands), np.nan)
+    wide[objIndex[keep], :, bandIndex[keep]] = vals[keep]
+
+    columns = list('{0}_{1}'.format(name, b) for name in features
+                   for b in bands)
+    df = pd.DataFrame(wide.reshape(len(objects), numFeatures * numBands),
+                      index=pd.Index(objects, name='snid'),
+                      columns=columns)
+
+    if colors:
+        peak = wide[:, list(features).index('peakflux'), :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for i in range(numBands - 1):
+                ratio = peak[:, i] / peak[:, i + 1]
+                ratio[~(ratio > 0.)] = np.nan
+                df['color_{0}_{1}'.format(bands[i], bands[i + 1])] = \
+                    -2.5 * np.log10(ratio)
+    return df
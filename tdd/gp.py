@@ -0,0 +1,205 @@
+"""
+Gaussian process interpolation of multi-band light curves, modeling each
+object as a Gaussian process in two dimensions (time, wavelength) with a
+fixed kernel family: a Matern 3/2 kernel in time multiplied by a squared
+exponential kernel in wavelength. Objects with the same number of
+observations are solved together through batched Cholesky decompositions.
+"""
+from __future__ import absolute_import, print_function, division
+import multiprocessing
+import numpy as np
+import pandas as pd
+from .tensors import _referenceEpochs
+
+__all__ = ['lsst_wavelengths', 'gp_kernel', 'gp_interpolate']
+
+# Effective wavelengths of the LSST bands in Angstroms
+lsst_wavelengths = dict(lsstu=3671., lsstg=4827., lsstr=6223., lssti=7546.,
+                        lsstz=8691., lssty=9712.)
+
+
+def gp_kernel(dt, dlam, amplitude, timeScale=20., wavelengthScale=6000.):
+    """
+    covariance between observations separated by `dt` in time and `dlam` in
+    wavelength
+
+    Parameters
+    ----------
+    dt : `np.ndarray`
+        differences in time, units of days
+    dlam : `np.ndarray`
+        differences in wavelength, units of Angstroms
+    amplitude : float or `np.ndarray` broadcastable to `dt`
+        amplitude of the Gaussian process, in units of flux
+    timeScale : float, defaults to 20.
+        length scale of the Matern 3/2 kernel in time
+    wavelengthScale : float, defaults to 6000.
+        length scale of the squared exponential kernel in wavelength
+    """
+    r = np.sqrt(3.) * np.abs(dt) / timeScale
+    return amplitude**2 * (1. + r) * np.exp(-r) \
+        * np.exp(-0.5 * (dlam / wavelengthScale)**2)
+
+
+def _gpChunk(args):
+    """
+    Gaussian process predictions for a chunk of complete objects, whose rows
+    are sorted by object
+    """
+    (trel, lam, flux, fluxerr, objStarts, predTimes, predLam, timeScale,
+     wavelengthScale, maxBatchElements) = args
+
+    numObjects = len(objStarts) - 1
+    counts = np.diff(objStarts)
+    starts = objStarts[:-1]
+    numPred = len(predTimes)
+    mean = np.zeros((numObjects, numPred))
+    std = np.zeros((numObjects, numPred))
+    if numObjects == 0:
+        return mean, std
+
+    amplitudes = np.maximum.reduceat(np.abs(flux), starts)
+    amplitudes[amplitudes <= 0.] = 1.
+
+    for n in np.unique(counts):
+        objs = np.flatnonzero(counts == n)
+        batchSize = max(1, maxBatchElements // (n * max(n, numPred)))
+        for i in range(0, len(objs), batchSize):
+            o = objs[i: i + batchSize]
+            idx = starts[o][:, np.newaxis] + np.arange(n)
+            t = trel[idx]
+            l = lam[idx]
+            amp = amplitudes[o][:, np.newaxis, np.newaxis]
+
+            K = gp_kernel(t[:, :, np.newaxis] - t[:, np.newaxis, :],
+                          l[:, :, np.newaxis] - l[:, np.newaxis, :],
+                          amp, timeScale, wavelengthScale)
+            diag = np.arange(n)
+            K[:, diag, diag] += fluxerr[idx]**2 + 1.0e-8 * amp[:, :, 0]**2
+            L = np.linalg.cholesky(K)
+
+            z = np.linalg.solve(L, flux[idx][:, :, np.newaxis])
+            alpha = np.linalg.solve(np.swapaxes(L, 1, 2), z)
+
+            Ks = gp_kernel(predTimes[np.newaxis, :, np.newaxis]
+                           - t[:, np.newaxis, :],
+                           predLam[np.newaxis, :, np.newaxis]
+                           - l[:, np.newaxis, :],
+                           amp, timeScale, wavelengthScale)
+            mean[o] = np.matmul(Ks, alpha)[:, :, 0]
+            v = np.linalg.solve(L, np.swapaxes(Ks, 1, 2))
+            var = amp[:, :, 0]**2 - np.sum(v**2, axis=1)
+            std[o] = np.sqrt(np.clip(var, 0., None))
+    return mean, std
+
+
+def gp_interpolate(phot, bands, times, reference='peak', timeScale=20.,
+                   wavelengthScale=6000., bandWavelengths=None,
+                   detectionSNR=5., objectsPerChunk=1000, nproc=1,
+                   maxBatchElements=20000000):
+    """
+    Fit each object in the photometry table with a Gaussian process in
+    (time, wavelength) with the kernel `gp_kernel`, and return the
+    predictions at `times` relative to the reference epoch of each object
+    in each of `bands`. The amplitude of the Gaussian process of an object
+    is set to its maximum absolute flux, and the length scales are fixed.
+
+    Parameters
+    ----------
+    phot : `pd.DataFrame`, `PhotTables` or `LightCurve`
+        photometry with columns `band`, `mjd`, `flux`, `fluxerr` and `snid`.
+        If there is no `snid` column, all of the rows are assumed to belong
+        to one object.
+    bands : sequence of strings
+        bands at which predictions are required
+    times : `np.ndarray` of floats
+        times relative to the reference epoch at which predictions are
+        required, units of days
+    reference : {'peak', 'first_detection', 'first'}, defaults to 'peak'
+        reference epoch of each object, see `light_curve_tensor`
+    timeScale : float, units of days, defaults to 20.
+        length scale in time
+    wavelengthScale : float, units of Angstroms, defaults to 6000.
+        length scale in wavelength
+    bandWavelengths : dictionary, defaults to None
+        effective wavelengths of the bands in Angstroms. If None,
+        `lsst_wavelengths` is used. Photometry in bands not in the dictionary
+        is ignored.
+    detectionSNR : float, defaults to 5.
+        threshold on SNR for detections, used if `reference` is
+        'first_detection'
+    objectsPerChunk : int, defaults to 1000
+        number of objects in each chunk sent to a process
+    nproc : int, defaults to 1
+        number of processes
+    maxBatchElements : int, defaults to 20000000
+        maximal number of elements of the stacks of covariance matrices in
+        a batch, which bounds the memory used by each process
+
+    Returns
+    -------
+    tuple of `np.ndarray` (snid, mean, std) where `mean` and `std` are
+    float32 arrays of shape (number of objects, number of bands, number of
+    times) of the predictions and their uncertainties
+    """
+    if bandWavelengths is None:
+        bandWavelengths = lsst_wavelengths
+    lcs = getattr(phot, 'lcs', phot)
+    if not isinstance(lcs, pd.DataFrame):
+        lcs = phot.lightCurve
+
+    bands = list(bands)
+    times = np.asarray(times, dtype=np.float64)
+    predTimes = np.tile(times, len(bands))
+    predLam = np.repeat(list(bandWavelengths[b] for b in bands), len(times))
+
+    lam = lcs['band'].map(bandWavelengths).values.astype(np.float64)
+    mjd = lcs['mjd'].values.astype(np.float64)
+    flux = lcs['flux'].values.astype(np.float64)
+    fluxerr = lcs['fluxerr'].values.astype(np.float64)
+    if 'snid' in lcs.columns:
+        snid = lcs['snid'].values
+    else:
+        snid = np.zeros(len(lcs), dtype=np.int64)
+
+    sel = np.isfinite(lam) & np.isfinite(mjd) & np.isfinite(flux) \
+        & np.isfinite(fluxerr)
+    order = np.flatnonzero(sel)
+    order = order[np.lexsort((mjd[order], snid[order]))]
+    snid, lam, mjd = snid[order], lam[order], mjd[order]
+    flux, fluxerr = flux[order], fluxerr[order]
+
+    objStarts = np.flatnonzero(np.append(True, snid[1:] != snid[:-1])) \
+        if len(snid) > 0 else np.zeros(0, dtype=np.int64)
+    snids = snid[objStarts]
+    epochs = _referenceEpochs(mjd, flux, fluxerr, objStarts, reference,
+                              detectionSNR) if len(snids) > 0 else mjd
+    trel = mjd - np.repeat(epochs, np.diff(np.append(objStarts, len(mjd))))
+    objStarts = np.append(objStarts, len(snid))
+
+    chunks = []
+    for i in range(0, len(snids), objectsPerChunk):
+        bounds = objStarts[i: i + objectsPerChunk + 1]
+        r0, r1 = bounds[0], bounds[-1]
+        chunks.append((trel[r0:r1], lam[r0:r1], flux[r0:r1],
+                       fluxerr[r0:r1], bounds - r0, predTimes, predLam,
+                       timeScale, wavelengthScale, maxBatchElements))
+
+    if nproc > 1 and len(chunks) > 1:
+        pool = multiprocessing.Pool(nproc)
+        try:
+            results = pool.map(_gpChunk, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = list(map(_gpChunk, chunks))
+
+    shape = (len(snids), len(bands), len(times))
+    mean = np.zeros(shape, dtype=np.float32)
+    std = np.zeros(shape, dtype=np.float32)
+    for i, (m, s) in enumerate(results):
+        start = i * objectsPerChunk
+        mean[start: start + len(m)] = m.reshape((len(m),) + shape[1:])
+        std[start: start + len(s)] = s.reshape((len(s),) + shape[1:])
+    return snids, mean, std
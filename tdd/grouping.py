@@ -0,0 +1,175 @@
+"""
+Precomputed grouping of photometry tables by a set of keys (eg. (`snid`,
+`band`) or (`snid`, `band`, `night`)). The keys are factorized and sorted
+once, and the group codes, sort permutation and group boundaries are shared
+by the aggregations (`LightCurve.coaddpreprocessed`, `LightCurve.summarize`,
+`Photometry.statTable`, ...) applied to the same table.
+"""
+from __future__ import absolute_import, print_function, division
+import numpy as np
+import pandas as pd
+
+__all__ = ['GroupIndex']
+
+
+class GroupIndex(object):
+    """
+    Grouping of the rows of a table by the values of a set of keys. Groups
+    are numbered in the lexicographic order of the key values, and rows with
+    a missing key value do not belong to any group, as in `pd.groupby`.
+
+    Parameters
+    ----------
+    keys : sequence of array like
+        values of each key for each row
+    names : sequence of strings, defaults to None
+        names of the keys
+
+    Attributes
+    ----------
+    codes : `np.ndarray` of int64
+        group of each row, -1 for rows not in any group
+    order : `np.ndarray` of int64
+        stable permutation of the rows in groups, sorted by group
+    starts : `np.ndarray` of int64
+        position in `order` of the first row of each group
+    sizes : `np.ndarray` of int64
+        number of rows in each group
+    levels : list of `pd.Index`
+        sorted unique values of each key
+    levelCodes : list of `np.ndarray`
+        position in `levels` of the key values of each group
+    """
+    def __init__(self, keys, names=None):
+        keys = list(keys)
+        if names is None:
+            names = list(getattr(key, 'name', None) for key in keys)
+        self.names = list(names)
+        self.numRows = len(keys[0]) if len(keys) > 0 else 0
+
+        rowCodes = []
+        self.levels = []
+        for key in keys:
+            codes, uniques = pd.factorize(np.asarray(key), sort=True)
+            rowCodes.append(codes.astype(np.int64))
+            self.levels.append(pd.Index(uniques))
+        valid = np.ones(self.numRows, dtype=bool)
+        for codes in rowCodes:
+            valid &= codes >= 0
+        rows = np.flatnonzero(valid)
+
+        # sort rows by the combined key if it fits in int64
+        sizes = list(max(len(level), 1) for level in self.levels)
+        if np.sum(np.log2(sizes)) < 62:
+            combined = np.zeros(len(rows), dtype=np.int64)
+            for (codes, size) in zip(rowCodes, sizes):
+                combined = combined * size + codes[rows]
+            perm = np.argsort(combined, kind='mergesort')
+            combined = combined[perm]
+            change = combined[1:] != combined[:-1]
+        else:
+            perm = np.lexsort(tuple(codes[rows] for codes in rowCodes[::-1]))
+            change = np.zeros(max(len(rows) - 1, 0), dtype=bool)
+            for codes in rowCodes:
+                sortedCodes = codes[rows][perm]
+                change |= sortedCodes[1:] != sortedCodes[:-1]
+        self.order = rows[perm]
+        self.starts = np.flatnonzero(np.append(True, change)) \
+            if len(rows) > 0 else np.zeros(0, dtype=np.int64)
+        self.sizes = np.diff(np.append(self.starts, len(rows)))
+
+        self.codes = np.full(self.numRows, -1, dtype=np.int64)
+        self.codes[self.order] = np.repeat(np.arange(self.numGroups),
+                                           self.sizes)
+        firstRows = self.order[self.starts]
+        self.levelCodes = list(codes[firstRows] for codes in rowCodes)
+
+    @classmethod
+    def fromFrame(cls, df, keys=('snid', 'band')):
+        """
+        `GroupIndex` of the rows of `df` grouped by the columns `keys`
+        """
+        keys = list(keys)
+        return cls(list(df[key].values for key in keys), names=keys)
+
+    def __len__(self):
+        return self.numGroups
+
+    @property
+    def numGroups(self):
+        return len(self.starts)
+
+    @property
+    def nbytes(self):
+        arrays = [self.codes, self.order, self.starts, self.sizes]
+        return int(sum(arr.nbytes for arr in arrays + self.levelCodes))
+
+    @property
+    def index(self):
+        """
+        `pd.Index` (`pd.MultiIndex` for several keys) of the key values of
+        each group
+        """
+        if len(self.levels) == 1:
+            return pd.Index(self.levels[0].take(self.levelCodes[0]),
+                            name=self.names[0])
+        return pd.MultiIndex(levels=self.levels, codes=self.levelCodes,
+                             names=self.names)
+
+    def keyValues(self, i):
+        """
+        values of the key `i` (position or name) for each group
+        """
+        if not isinstance(i, int):
+            i = self.names.index(i)
+        return self.levels[i].values.take(self.levelCodes[i])
+
+    def checkRows(self, numRows):
+        if numRows != self.numRows:
+            raise ValueError('GroupIndex was built for a table with a '
+                             'different number of rows', self.numRows,
+                             numRows)
+
+    def grouper(self, mask=None):
+        """
+        `pd.Categorical` of the groups of the rows (of the rows selected by
+        the boolean array `mask`), to be passed to `pd.DataFrame.groupby`
+        with `observed=True`. Grouping on it does not factorize the keys
+        again. The groups of the result are numbered as in `index`.
+        """
+        codes = self.codes if mask is None else self.codes[mask]
+        return pd.Categorical.from_codes(codes,
+                                         categories=np.arange(self.numGroups))
+
+    def labels(self, groups):
+        """
+        key values (as in `index`) of the group numbers `groups`, eg. the
+        index of the result of a groupby on `grouper`
+        """
+        return self.index[np.asarray(groups, dtype=np.int64)]
+
+    def reduce(self, ufunc, values):
+        """
+        reduce `values` over each group with the `np.ufunc` `ufunc`
+        """
+        if self.numGroups == 0:
+            return np.zeros(0, dtype=np.asarray(values).dtype)
+        return ufunc.reduceat(np.asarray(values)[self.order], self.starts)
+
+    def sum(self, values):
+        """
+        sum of `values` over each group
+        """
+        valid = self.codes >= 0
+        if valid.all():
+            return np.bincount(self.codes, weights=values,
+                               minlength=self.numGroups)
+        return np.bincount(self.codes[valid],
+                           weights=np.asarray(values)[valid],
+                           minlength=self.numGroups)
+
+    def first(self, values):
+        """
+        value in the first row of each group
+        """
+        return np.asarray(values)[self.order[self.starts]]
@@ -5,17 +5,21 @@ be found in `examples/ObsHistIDsForTile`
 from __future__ import print_function, absolute_import, division
 import subprocess
 import sqlite3
-from itertools import repeat
 from datetime import datetime
+import os
 import sys
+import copy
+import json
+import multiprocessing
 import numpy as np
+import pandas as pd
 import healpy as hp
-from scipy.sparse import csr_matrix
-from .opsim_out import OpSimOutput
-from .trig import convertToCelestialCoordinates
-from past.builtins import basestring, xrange
+from scipy.sparse import csr_matrix, csc_matrix, vstack
+from .nested import (children, parents, pixels_to_ranges, ragged_arange,
+                     nside_to_order)
 
-__all__ = ['addVec', 'HealPixelizedOpSim', 'HealpixTree', 'healpix_boundaries']
+__all__ = ['addVec', 'pointing_vectors', 'HealPixelizedOpSim', 'HealpixTree', 'healpix_boundaries',
+           'query_discs', 'HealPixelizedOpSimPyramid']
 
 def healpix_boundaries(ipix, nside=256, step=2, nest=True,
 		       convention='spherical',
@@ -56,6 +60,7 @@ def healpix_boundaries(ipix, nside=256, step=2, nest=True,
     # These are in radians and spherical coordinates by construction
     theta, phi = phi_theta
     if convention == 'celestial':
+        from .trig import convertToCelestialCoordinates
         return convertToCelestialCoordinates(theta, phi, output_unit=units)
     # else return in spherical coordinates, but convert to degrees if requested
     if units == 'degrees':
@@ -107,12 +112,7 @@ class HealpixTree(object):
         i = np.ravel(i)
         if any(i > hp.nside2npix(nside) -1):
             raise ValueError('ipix too large for nside')
-
-        binval = np.repeat(np.binary_repr(i, width=2), 4)
-        num = np.array(list(np.binary_repr(x, width=2) for x in np.arange(4)))
-        binPix = np.array(list(x + y for (x, y)  in zip(binval, num)))
-        intPix = list(np.int(i, base=2) for i in binPix)
-        return nside*2, np.array(intPix)
+        return nside*2, children(i, 1)
 
     def pixelsAtNextLevel(self, ipix, nside=None):
         """
@@ -133,10 +133,7 @@ class HealpixTree(object):
         """
         if nside is None:
             nside = self.nside
-        ipix = np.ravel(ipix)
-        xx = list(self._pixelsAtNextLevel(pix, nside) for pix in ipix)
-        nsides, pix = zip(*xx)
-        return nsides[0], np.concatenate(pix)
+        return self._pixelsAtNextLevel(ipix, nside)
 
     def pixelsAtResolutionLevel(self, ipix, subdivisions, nside=None):
         """
@@ -160,16 +157,68 @@ class HealpixTree(object):
         """
         if nside is None:
             nside = self.nside
-        levels = subdivisions
-        while levels >= 1:
-            nside, ivals = self.pixelsAtNextLevel(ipix, nside=nside)
-            ipix = ivals
-            levels += -1
-        return nside, ipix
+        ipix = np.ravel(ipix)
+        if any(ipix > hp.nside2npix(nside) -1):
+            raise ValueError('ipix too large for nside')
+        return nside * 2**subdivisions, children(ipix, subdivisions)
+
+    def ancestorsAtResolutionLevel(self, ipix, subdivisions, nside=None):
+        """
+        Given a `numpy.ndarray` of pixels at NSIDE=nside, return the
+        `numpy.ndarray` of the ids of the pixels containing them at
+        NSIDE = nside / (2**subdivisions)
+
+        Return
+        ------
+        tuple of the NSIDE of the ancestors and their ids
+        """
+        if nside is None:
+            nside = self.nside
+        if 2**subdivisions > nside:
+            raise ValueError('subdivisions too large for nside')
+        return nside // 2**subdivisions, parents(ipix, subdivisions)
+
+    def descendantRanges(self, ipix, subdivisions, nside=None):
+        """
+        Given a `numpy.ndarray` of pixels at NSIDE=nside, return the half
+        open ranges [start, end) of the ids of their descendants at
+        NSIDE = nside * (2**subdivisions), merged into sorted disjoint ranges.
+        Membership of pixel ids in the ranges is tested with
+        `tdd.nested.in_ranges`.
+
+        Return
+        ------
+        tuple of the NSIDE of the descendants and of `np.ndarray` (starts,
+        ends)
+        """
+        if nside is None:
+            nside = self.nside
+        return nside * 2**subdivisions, pixels_to_ranges(ipix, subdivisions)
+
+def pointing_vectors(df, raCol='ditheredRA', decCol='ditheredDec'):
+    """
+    unit vectors of the pointings of the dataFrame df as a contiguous
+    `np.ndarray` of shape (N, 3)
+
+    Parameters
+    ----------
+    df : `pd.DataFrame`
+        dataframe with two columns raCol and decCol having ra,
+        dec in radians.
+    raCol : string, optional, defaults to 'ditheredRA'
+        column name for the column which has ra values
+    decCol : string, optional, defaults to 'ditheredDec'
+        column name for the column which has dec values
+    """
+    thetas = - np.asarray(df[decCol], dtype=np.float64) + np.pi / 2.
+    phis = np.asarray(df[raCol], dtype=np.float64)
+    return np.ascontiguousarray(hp.ang2vec(thetas, phis), dtype=np.float64)
+
 
 def addVec(df, raCol='ditheredRA', decCol='ditheredDec'):
     """
-    Add a column of vectors to the dataFrame df
+    Add a column of vectors to the dataFrame df. `pointing_vectors` gives the
+    vectors as a single array, which is much smaller and faster to use.
 
     Parameters
     ----------
@@ -181,9 +230,126 @@ def addVec(df, raCol='ditheredRA', decCol='ditheredDec'):
     decCol : string, optional, defaults to 'ditheredDec'
         column name for the column which has dec values
     """
-    thetas  = - df[decCol] + np.pi /2.
-    phis = df[raCol]
-    df['vec'] = list(hp.ang2vec(thetas, phis))
+    df['vec'] = list(pointing_vectors(df, raCol=raCol, decCol=decCol))
+
+def _insertSimlib(conn, ipix, obsHistIDs, batchSize=1000000, verbose=False):
+    """
+    insert the records (`ipix`, `obsHistIDs`) into the `simlib` table of the
+    database connection `conn`, committing every `batchSize` records
+    """
+    cur = conn.cursor()
+    numRecords = len(ipix)
+    for first in range(0, numRecords, batchSize):
+        last = min(first + batchSize, numRecords)
+        records = zip(np.asarray(ipix[first:last]).tolist(),
+                      np.asarray(obsHistIDs[first:last]).tolist())
+        cur.executemany('INSERT INTO simlib VALUES (?, ?)', records)
+        conn.commit()
+        if verbose:
+            print('committed {} records to db'.format(last))
+            sys.stdout.flush()
+
+
+def _updateNumRecords(conn):
+    cur = conn.cursor()
+    numRecords = cur.execute('SELECT COUNT(*) FROM simlib').fetchone()[0]
+    cur.execute('UPDATE metadata SET numRecords = ?', (numRecords,))
+    conn.commit()
+    return numRecords
+
+
+def _queryDiscChunk(args):
+    """
+    pixels within `radius` of each of the unit vectors `vecs`, as the number
+    of pixels for each vector and the concatenated pixel ids
+    """
+    (vecs, nside, radius, inclusive, fact, nest) = args
+    lens = np.zeros(len(vecs), dtype=np.int64)
+    pixels = []
+    for (i, vec) in enumerate(vecs):
+        pix = hp.query_disc(nside, vec, radius, inclusive=inclusive,
+                            fact=fact, nest=nest)
+        lens[i] = len(pix)
+        pixels.append(pix)
+    if len(pixels) == 0:
+        return lens, np.zeros(0, dtype=np.int64)
+    return lens, np.concatenate(pixels).astype(np.int64)
+
+
+def query_discs(vecs, nside, radius, inclusive=True, fact=4, nest=True,
+                nproc=1, chunkSize=10000, dedup=True, tolerance=0.):
+    """
+    pixels within `radius` of each of a set of pointings, computed with
+    `hp.query_disc` on chunks of pointings distributed over a process pool
+
+    Parameters
+    ----------
+    vecs : `np.ndarray` of shape (N, 3)
+        unit vectors of the pointings
+    nside : int
+        Healpix NSIDE
+    radius : float, radians
+        radius of the discs
+    inclusive : Bool, defaults to True
+        `inclusive` parameter of `hp.query_disc`
+    fact : int, defaults to 4
+        `fact` parameter of `hp.query_disc`
+    nest : Bool, defaults to True
+        if True, NESTED pixel ids, else RING
+    nproc : int, defaults to 1
+        number of processes
+    chunkSize : int, defaults to 10000
+        number of pointings in each task
+    dedup : Bool, defaults to True
+        if True, the discs are computed once for each distinct center and
+        gathered for the pointings sharing it, which is much faster for
+        surveys revisiting the same fields
+    tolerance : float, defaults to 0.
+        if positive, centers whose unit vectors agree when quantized to
+        `tolerance` are considered the same, and the disc of the first
+        such pointing is used for all of them
+
+    Returns
+    -------
+    tuple of `np.ndarray` (rows, cols) of int64, where rows are the indices
+    of the pointings in `vecs` and cols the pixels associated with them
+    """
+    vecs = np.asarray(vecs, dtype=np.float64).reshape(-1, 3)
+    if dedup and len(vecs) > 0:
+        keys = vecs if tolerance <= 0. else np.round(vecs / tolerance)
+        _, first, inverse = np.unique(keys, axis=0, return_index=True,
+                                      return_inverse=True)
+        inverse = inverse.ravel()
+        urows, ucols = query_discs(vecs[first], nside, radius,
+                                   inclusive=inclusive, fact=fact, nest=nest,
+                                   nproc=nproc, chunkSize=chunkSize,
+                                   dedup=False)
+        # gather the discs of the distinct centers for each pointing
+        ulens = np.bincount(urows, minlength=len(first))
+        ustarts = np.cumsum(ulens) - ulens
+        lens = ulens[inverse]
+        rows = np.repeat(np.arange(len(vecs), dtype=np.int64), lens)
+        cols = ucols[ragged_arange(ustarts[inverse], ustarts[inverse] + lens)]
+        return rows, cols
+
+    tasks = list((vecs[i: i + chunkSize], nside, radius, inclusive, fact,
+                  nest) for i in range(0, len(vecs), chunkSize))
+    if nproc > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(nproc)
+        try:
+            results = pool.map(_queryDiscChunk, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = list(map(_queryDiscChunk, tasks))
+    if len(results) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    lens = np.concatenate(list(res[0] for res in results))
+    cols = np.concatenate(list(res[1] for res in results))
+    rows = np.repeat(np.arange(len(vecs), dtype=np.int64), lens)
+    return rows, cols
+
 
 class HealPixelizedOpSim(object):
     """
@@ -206,8 +372,10 @@ class HealPixelizedOpSim(object):
     NSIDE : integer, `healpy.NSIDE`
         `NSIDE` for healpix giving rise to 12NSIDE **2 pixels on the sphere
     vecColName : string, optional, defaults to 'vec'
-        column name where 3D vectors are computed corresponding to the angles
-        of the pointing direction of the OpSim record.
+        column name of 3D vectors corresponding to the angles of the pointing
+        direction of the OpSim record, if it is a column of `opsimDF`.
+        Otherwise, the vectors are computed from the angles. The vectors are
+        stored as the (N, 3) array `vecs`.
     fieldRadius : float, optional, defaults to 1.75, units is degrees
         radius of the field in degrees
     inclusive : bool, optional, defaults to True
@@ -225,13 +393,15 @@ class HealPixelizedOpSim(object):
     source : string, optional, defaults to None
         if not None, used to record the absolute path or name of the OpSim
         output database on which this object was based
+    nproc : int, optional, defaults to 1
+        number of processes used in `doPreCalcs`
     Methods
     -------
     """
 
     def __init__(self, opsimDF, raCol='ditheredRA', decCol='ditheredDec',
                  NSIDE=1, fact=4, inclusive=True, nest=True,
-                 vecColName='vec',  fieldRadius=1.75, source=None):
+                 vecColName='vec',  fieldRadius=1.75, source=None, nproc=1):
 
         self.raCol = raCol
         self.decCol = decCol
@@ -241,16 +411,22 @@ class HealPixelizedOpSim(object):
         self.validateDF()
         self._fieldRadius = np.radians(fieldRadius)
 
-        if vecColName not in self.cols:
-            addVec(self.opsimdf, raCol=self.raCol, decCol=self.decCol)
+        if vecColName in self.cols:
+            vecs = np.stack(self.opsimdf.pop(vecColName).values)
+            self.vecs = np.ascontiguousarray(vecs, dtype=np.float64)
+        else:
+            self.vecs = pointing_vectors(self.opsimdf, raCol=self.raCol,
+                                         decCol=self.decCol)
         self.nside = NSIDE
         self._rowdata = None
         self._coldata = None
         self._spmat = None
+        self._cscmat = None
         self.inclusive = inclusive
         self.fact = fact
         self.nest = nest
         self.source = source
+        self.nproc = nproc
 
     @classmethod
     def fromOpSimDB(cls, opSimDBpath, subset='unique_all', propIDs=None,
@@ -280,6 +456,7 @@ class HealPixelizedOpSim(object):
         propIDs = propIDs
         dbName = opSimDBpath
 
+        from .opsim_out import OpSimOutput
         opsimout = OpSimOutput.fromOpSimDB(opSimDBpath,subset=subset,
                                            tableNames=tableNames,
                                            zeroDDFDithers=zeroDDFDithers,
@@ -304,6 +481,7 @@ class HealPixelizedOpSim(object):
         propIDs = propIDs
         opsimHDF = opsimHDF
         
+        from .opsim_out import OpSimOutput
         opsimout = OpSimOutput.fromOpSimHDF(opSimHDF, subset=subset,
                                            tableNames=tableNames,
                                            propIDs=propIDs)
@@ -318,8 +496,32 @@ class HealPixelizedOpSim(object):
         return a `np.ndarray` of obsHistID values that intersect with the
         healpix tileID.
         """
-        inds = self.sparseMat.getcol(tileID).nonzero()[0]
-        return self.opsimdf.ix[inds, 'obsHistID'].values
+        csc = self.sparseMatCSC
+        inds = csc.indices[csc.indptr[tileID]:csc.indptr[tileID + 1]]
+        return self.opsimdf.obsHistID.values[inds]
+
+    def obsHistIdsForTiles(self, tileIDs):
+        """
+        obsHistID values that intersect with each of the healpix `tileIDs`,
+        as a ragged array: the obsHistIDs of `tileIDs[i]` are
+        `obsHistIDs[offsets[i]:offsets[i + 1]]`
+
+        Parameters
+        ----------
+        tileIDs : sequence of int
+            healpix tileIDs
+
+        Returns
+        -------
+        tuple of `np.ndarray` (obsHistIDs, offsets)
+        """
+        tileIDs = np.ravel(tileIDs).astype(np.int64)
+        csc = self.sparseMatCSC
+        first, last = csc.indptr[tileIDs], csc.indptr[tileIDs + 1]
+        offsets = np.zeros(len(tileIDs) + 1, dtype=np.int64)
+        np.cumsum(last - first, out=offsets[1:])
+        inds = csc.indices[ragged_arange(first, last)]
+        return self.opsimdf.obsHistID.values[inds], offsets
 
     @property
     def sparseMat(self):
@@ -335,24 +537,130 @@ class HealPixelizedOpSim(object):
                                      shape=shape)
         return self._spmat 
 
+    @property
+    def sparseMatCSC(self):
+        """
+        `sparseMat` in the compressed sparse column format, for fast access
+        to the pointings associated with tiles
+        """
+        if self._cscmat is None:
+            self._cscmat = self.sparseMat.tocsc()
+        return self._cscmat
+
     @property
     def rowdata(self):
         if self._rowdata is None:
-            self.doPreCalcs()
-        return np.asarray(self._rowdata)
+            if self._spmat is not None:
+                self._fromSparseMat()
+            else:
+                self.doPreCalcs()
+        return self._rowdata
 
 
     @property
     def coldata(self):
         if self._coldata is None:
-            self.doPreCalcs()
+            if self._spmat is not None:
+                self._fromSparseMat()
+            else:
+                self.doPreCalcs()
         return self._coldata
 
-    def write_metaData_Table(self, dbName, indexed, version=None, hostname=None):
+    def _fromSparseMat(self):
+        spmat = self._spmat
+        self._rowdata = np.repeat(np.arange(spmat.shape[0], dtype=np.int64),
+                                  np.diff(spmat.indptr))
+        self._coldata = np.asarray(spmat.indices, dtype=np.int64)
+
+    def writeToNpy(self, directory):
+        """
+        Write the association of pointings and healpix tileIDs to the
+        directory `directory` as `.npy` files of the arrays of the sparse
+        matrix in the CSR (`csr_indptr`, `csr_indices`) and CSC (`csc_indptr`,
+        `csc_indices`) formats, the obsHistID and the angles of the pointings
+        of each row, and a file `metadata.json` with the parameters. The
+        arrays are read back by `fromNpy` as memory maps. Existing files are
+        replaced only once written, so that a directory from which this
+        instance was loaded can be rewritten after an update.
+
+        Parameters
+        ----------
+        directory : string
+            directory created if it does not exist
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        csr = self.sparseMat
+        csc = self.sparseMatCSC
+        arrays = dict(csr_indptr=csr.indptr, csr_indices=csr.indices,
+                      csc_indptr=csc.indptr, csc_indices=csc.indices,
+                      obsHistID=self.opsimdf.obsHistID.values,
+                      ra=self.opsimdf[self.raCol].values,
+                      dec=self.opsimdf[self.decCol].values)
+        for (name, arr) in arrays.items():
+            fname = os.path.join(directory, name + '.npy')
+            np.save(fname + '.tmp.npy', arr)
+            os.replace(fname + '.tmp.npy', fname)
+        meta = dict(NSIDE=int(self.nside), fact=int(self.fact),
+                    inclusive=bool(self.inclusive), nest=bool(self.nest),
+                    raCol=self.raCol, decCol=self.decCol,
+                    fieldRadius=float(np.degrees(self._fieldRadius)),
+                    source=self.source, shape=list(map(int, csr.shape)),
+                    nnz=int(csr.nnz))
+        with open(os.path.join(directory, 'metadata.json'), 'w') as fh:
+            json.dump(meta, fh)
+
+    @classmethod
+    def fromNpy(cls, directory, opsimDF=None, mmap=True):
+        """
+        instance of the class with the associations written by `writeToNpy`
+        to `directory`, without recomputing them
+
+        Parameters
+        ----------
+        directory : string
+            directory written by `writeToNpy`
+        opsimDF : `pd.DataFrame`, defaults to None
+            OpSim records in the order of the rows of the stored matrix. If
+            None, a table of obsHistID and the angles is used.
+        mmap : Bool, defaults to True
+            if True, the arrays are memory mapped rather than read
+        """
+        with open(os.path.join(directory, 'metadata.json')) as fh:
+            meta = json.load(fh)
+        mode = 'r' if mmap else None
+
+        def load(name):
+            return np.load(os.path.join(directory, name + '.npy'),
+                           mmap_mode=mode)
+
+        obsHistID = load('obsHistID')
+        if opsimDF is None:
+            opsimDF = pd.DataFrame({meta['raCol']: load('ra'),
+                                    meta['decCol']: load('dec')},
+                                   index=pd.Index(obsHistID,
+                                                  name='obsHistID'))
+        elif len(opsimDF) != len(obsHistID):
+            raise ValueError('opsimDF does not match the stored pointings')
+        hpOpSim = cls(opsimDF, raCol=meta['raCol'], decCol=meta['decCol'],
+                      NSIDE=meta['NSIDE'], fact=meta['fact'],
+                      inclusive=meta['inclusive'], nest=meta['nest'],
+                      fieldRadius=meta['fieldRadius'], source=meta['source'])
+
+        shape = tuple(meta['shape'])
+        nnz = meta['nnz']
+        hpOpSim._spmat = csr_matrix((np.ones(nnz), load('csr_indices'),
+                                     load('csr_indptr')), shape=shape)
+        hpOpSim._cscmat = csc_matrix((np.ones(nnz), load('csc_indices'),
+                                      load('csc_indptr')), shape=shape)
+        return hpOpSim
+
+    def write_metaData_Table(self, dbName, indexed, version=None, hostname=None,
+                             numRecords=None, conn=None):
         """
         write out the metadata table to the sqlite database `dbName`. The
         columns of the table are hostname, CodeVersion, NSIDE, fact, indexed,
-        inclusive, timestamp
+        inclusive, timestamp, numRecords
 
         Parameters
         ----------
@@ -367,10 +675,16 @@ class HealPixelizedOpSim(object):
         hostname : string, optional, defaults to None
             if None, the hostname is derived by using a subprocess call to the
             unix commandline `hostname`. Else, can be supplied.
+        numRecords : int, optional, defaults to None
+            number of records of the `simlib` table
+        conn : `sqlite3.Connection`, optional, defaults to None
+            open connection to the database, in which case the table is
+            written in the current transaction, which is not committed.
+            Otherwise, a connection to `dbName` is opened and committed.
         """
-        print('write metadata table to database')
-        sys.stdout.flush()
-        conn = sqlite3.Connection(dbName)
+        ownConnection = conn is None
+        if ownConnection:
+            conn = sqlite3.Connection(dbName)
         cur = conn.cursor()
 
         if version is None:
@@ -379,15 +693,12 @@ class HealPixelizedOpSim(object):
         if hostname is None:
             proc = subprocess.Popen('hostname', stdout=subprocess.PIPE)
             hostname, err = proc.communicate()
-        
+            hostname = hostname.decode().strip()
 
         # TimeStamp
-        mytime = datetime.now() 
+        mytime = datetime.now()
         timestamp = 'Timestamp: {:%Y-%b-%d %H:%M:%S}'.format(mytime)
 
-        # source
-        source = self.source
-
         cur.execute('CREATE TABLE metadata ('
                                             'hostname varchar(100),'
                                             'source varchar(100),'
@@ -398,32 +709,35 @@ class HealPixelizedOpSim(object):
                                             'fact int,'
                                             'inclusive varchar(10),'
                                             'indexed varchar(1),'
-                                            'timestamp varchar(30))')
+                                            'timestamp varchar(30),'
+                                            'numRecords int)')
         insertStatement = 'INSERT INTO metadata '
         insertStatement += '(hostname, source, raCol, decCol, CodeVersion,'
         insertStatement += ' NSIDE, fact, inclusive,'
-        insertStatement += ' indexed, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
-
-        x = '{0},{1},{2},{3},{4},{5},{6},{7}, {8}, {9}'.format(hostname,
-                                                       source, self.raCol,
-                                                       self.decCol, version,
-                                                       self.nside, self.fact,
-                                                       self.inclusive, indexed,
-                                                       timestamp)
-        vals = tuple(x.split(','))
-        print(insertStatement)
+        insertStatement += ' indexed, timestamp, numRecords)'
+        insertStatement += ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+
+        vals = (str(hostname), str(self.source), self.raCol, self.decCol,
+                str(version), int(self.nside), int(self.fact),
+                str(self.inclusive), str(indexed), timestamp,
+                None if numRecords is None else int(numRecords))
         cur.execute(insertStatement, vals)
-        conn.commit()                                            
+        if ownConnection:
+            conn.commit()
+            conn.close()
         return
 
     def writeToDB(self, dbName, verbose=False, indexed=True, version=None,
-                  hostname=None):
+                  hostname=None, batchSize=1000000):
         """
         Write two tables to a SQLITE database. The first table is called Simlib
         and records association of obsHistIDs and Healpix TileIDs in a two
         column table. The second table is called metadata which records the
         provenance information in the table. The Simlib table may or may not be
-        indexed
+        indexed. The records are inserted in bulk in batches of `batchSize`,
+        with the journal and synchronous writes turned off during the load,
+        and the indexes are created after the load.
+
         Parameters
         ----------
         dbName : string, mandatory
@@ -440,62 +754,182 @@ class HealPixelizedOpSim(object):
         hostname : string, optional, defaults to None
             The hostname is used to supply the parameter in the metadata table.
             If None, that should be found by using the *NIX `hostname` command.
+        batchSize : int, optional, defaults to 1000000
+            number of records inserted in each transaction
 
         .. notes : It is assumed that the file does not exist but the directory
         does.
         """
         rowdata = self.rowdata
         coldata = self.coldata
+        numRecords = len(rowdata)
         if verbose:
             print(len(rowdata), len(coldata))
-        obsHistIDs = self.opsimdf.ix[rowdata, 'obsHistID'].values
+        obsHistIDs = self.opsimdf.obsHistID.values[rowdata]
 
         conn = sqlite3.Connection(dbName)
-        cur = conn.cursor()
-        cur.execute('CREATE TABLE simlib (ipix int, obsHistId int)')
-        for i in range(len(rowdata)):
-            cur.execute('INSERT INTO simlib VALUES'
-                        '({1}, {0})'.format(obsHistIDs[i], coldata[i]))
-            if i % 100000 == 0:
-                conn.commit()
+        try:
+            cur = conn.cursor()
+            # The database is written from scratch, so that a failed load is
+            # rewritten rather than recovered
+            cur.execute('PRAGMA journal_mode = OFF')
+            cur.execute('PRAGMA synchronous = OFF')
+            cur.execute('CREATE TABLE simlib (ipix int, obsHistId int)')
+            _insertSimlib(conn, coldata, obsHistIDs, batchSize=batchSize,
+                          verbose=verbose)
+
+            numWritten = cur.execute('SELECT COUNT(*) FROM simlib').fetchone()[0]
+            if numWritten != numRecords:
+                raise ValueError('number of records written to simlib does '
+                                 'not match the associations',
+                                 numWritten, numRecords)
+            # create index
+            if indexed:
                 if verbose:
-                    print('committed 100000 records to db')
-                    sys.stdout.flush()
-        conn.commit()
-        print('Committed the table to disk\n')
-        # create index
-        if indexed:
-            print('Createing ipix index\n')
-            cur.execute('CREATE INDEX {ix} on {tn}({cn})'\
-                        .format(ix='ipix_ind', tn='simlib', cn='ipix'))
-            print('Createing obsHistID index\n')
-            cur.execute('CREATE INDEX {ix} on {tn}({cn})'\
-                        .format(ix='obshistid_ind', tn='simlib', cn='obsHistId'))
+                    print('Creating ipix and obsHistID indexes\n')
+                cur.execute('CREATE INDEX {ix} on {tn}({cn})'\
+                            .format(ix='ipix_ind', tn='simlib', cn='ipix'))
+                cur.execute('CREATE INDEX {ix} on {tn}({cn})'\
+                            .format(ix='obshistid_ind', tn='simlib',
+                                    cn='obsHistId'))
+
+            # Write metadata table
+            self.write_metaData_Table(dbName=dbName, indexed=indexed,
+                                      version=version, hostname=hostname,
+                                      numRecords=numWritten, conn=conn)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def appendPointings(self, opsimDF, dbName=None, nproc=None,
+                        chunkSize=10000, dedup=True, tolerance=0.):
+        """
+        Append the OpSim records `opsimDF` (indexed by obsHistID, with the
+        columns raCol and decCol) to the pointings. Only the associations of
+        the new pointings are computed, and they are appended to the
+        associations and sparse matrix already computed or loaded. If none
+        are, the associations of the existing pointings are computed first.
+
+        Parameters
+        ----------
+        opsimDF : `pd.DataFrame`
+            new OpSim records, whose obsHistIDs must not be pointings already
+        dbName : string, optional, defaults to None
+            if not None, path to a database written by `writeToDB`, into which
+            the new associations are inserted
+        nproc, chunkSize, dedup, tolerance :
+            as in `doPreCalcs`, for the new pointings
+
+        .. notes : a directory written by `writeToNpy` is updated by calling
+        `writeToNpy` again.
+        """
+        if nproc is None:
+            nproc = self.nproc
+        for col in (self.raCol, self.decCol):
+            if col not in opsimDF.columns:
+                raise ValueError('{} not in OpSim cols'.format(col))
+        newdf = opsimDF.reset_index()
+        if np.isin(newdf.obsHistID.values,
+                   self.opsimdf.obsHistID.values).any():
+            raise ValueError('obsHistIDs to append are already pointings')
+        if self.vecColName in newdf.columns:
+            vecs = np.stack(newdf.pop(self.vecColName).values)
+            vecs = np.ascontiguousarray(vecs, dtype=np.float64)
         else:
-            print('Not creating index \n')
+            vecs = pointing_vectors(newdf, raCol=self.raCol,
+                                    decCol=self.decCol)
+        if self._spmat is None and self._rowdata is None:
+            self.doPreCalcs(nproc=nproc, chunkSize=chunkSize, dedup=dedup,
+                            tolerance=tolerance)
+        rows, cols = query_discs(vecs, self.nside, self._fieldRadius,
+                                 inclusive=self.inclusive, fact=self.fact,
+                                 nest=self.nest, nproc=nproc,
+                                 chunkSize=chunkSize, dedup=dedup,
+                                 tolerance=tolerance)
 
+        numOld = len(self.opsimdf)
+        if self._spmat is not None:
+            shape = (len(newdf), hp.nside2npix(self.nside))
+            newmat = csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                shape=shape)
+            self._spmat = vstack((self._spmat, newmat), format='csr')
+        if self._rowdata is not None:
+            self._rowdata = np.concatenate((self._rowdata, rows + numOld))
+            self._coldata = np.concatenate((self._coldata, cols))
+        self._cscmat = None
+        self.opsimdf = pd.concat((self.opsimdf, newdf), ignore_index=True)
+        self.vecs = np.concatenate((self.vecs, vecs))
 
-        conn.close()
-        # Write metadata table
-        self.write_metaData_Table(dbName=dbName, indexed=indexed,
-                                  version=version, hostname=hostname) 
-        
-    def doPreCalcs(self):
-        """
-        Perform the precalculations necessary to set up the sparse matrix.
-        """
-        self.opsimdf['hids'] = [hp.query_disc(self.nside, vec, self._fieldRadius,
-                                              inclusive=self.inclusive,
-                                              fact=self.fact,
-                                              nest=self.nest)
-                                for vec in self.opsimdf[self.vecColName]]
-        lens = list(map(len, self.opsimdf.hids.values))
-        rowdata = []
-        _ = list(rowdata.extend(repeat(i, lens[i]))
-                 for i in xrange(len(self.opsimdf)))
-        coldata = np.concatenate(self.opsimdf.hids.values)
-        self._rowdata = rowdata
-        self._coldata = coldata
+        if dbName is not None:
+            conn = sqlite3.Connection(dbName)
+            try:
+                _insertSimlib(conn, cols, newdf.obsHistID.values[rows])
+                _updateNumRecords(conn)
+            finally:
+                conn.close()
+
+    def removePointings(self, obsHistIDs, dbName=None):
+        """
+        Remove the pointings `obsHistIDs` and their associations, from the
+        associations and sparse matrix already computed or loaded, if any.
+
+        Parameters
+        ----------
+        obsHistIDs : sequence of int
+            obsHistIDs of the pointings to remove
+        dbName : string, optional, defaults to None
+            if not None, path to a database written by `writeToDB`, from which
+            the associations of the pointings are deleted
+        """
+        obsHistIDs = np.ravel(obsHistIDs)
+        keep = ~np.isin(self.opsimdf.obsHistID.values, obsHistIDs)
+        if self._spmat is not None:
+            self._spmat = self._spmat[np.flatnonzero(keep)]
+        if self._rowdata is not None:
+            # new row of each kept pointing
+            newRows = np.cumsum(keep) - 1
+            keepAssoc = keep[self._rowdata]
+            self._rowdata = newRows[self._rowdata[keepAssoc]]
+            self._coldata = self._coldata[keepAssoc]
+        self._cscmat = None
+        self.opsimdf = self.opsimdf[keep].reset_index(drop=True)
+        self.vecs = self.vecs[keep]
+
+        if dbName is not None:
+            conn = sqlite3.Connection(dbName)
+            try:
+                conn.cursor().executemany(
+                    'DELETE FROM simlib WHERE obsHistId = ?',
+                    ((int(obsHistID),) for obsHistID in obsHistIDs))
+                conn.commit()
+                _updateNumRecords(conn)
+            finally:
+                conn.close()
+
+    def doPreCalcs(self, nproc=None, chunkSize=10000, dedup=True,
+                   tolerance=0.):
+        """
+        Perform the precalculations necessary to set up the sparse matrix:
+        the flat arrays `rowdata` (row of the pointing in `opsimdf`) and
+        `coldata` (healpix tileID) of the associations, computed in chunks of
+        `chunkSize` pointings over `nproc` processes (defaults to
+        `self.nproc`). With `dedup`, the associations are computed once for
+        each distinct pointing center (within `tolerance`), as described in
+        `query_discs`.
+        """
+        if nproc is None:
+            nproc = self.nproc
+        self._rowdata, self._coldata = query_discs(self.vecs, self.nside,
+                                                   self._fieldRadius,
+                                                   inclusive=self.inclusive,
+                                                   fact=self.fact,
+                                                   nest=self.nest,
+                                                   nproc=nproc,
+                                                   chunkSize=chunkSize,
+                                                   dedup=dedup,
+                                                   tolerance=tolerance)
+        self._spmat = None
+        self._cscmat = None
 
     def validateDF(self):
         if self.raCol not in self.cols:
@@ -504,3 +938,121 @@ class HealPixelizedOpSim(object):
             raise ValueError('decCol {} not in OpSim cols'.format(self.decCol))
         return
 
+    def atNside(self, nside):
+        """
+        instance with the associations of the pointings and the healpix tiles
+        at the coarser NSIDE `nside`, derived from these associations without
+        querying discs: a pointing is associated with the ancestors of the
+        tiles it is associated with. With `inclusive`, these are a subset of
+        the associations queried at `nside`, which approximate the overlaps
+        at a coarser resolution. The instance shares the OpSim records.
+
+        Parameters
+        ----------
+        nside : int
+            healpix NSIDE, a power of 2 not larger than `self.nside`
+        """
+        if not self.nest:
+            raise ValueError('coarser associations require the NESTED scheme')
+        k = nside_to_order(self.nside) - nside_to_order(nside)
+        if k < 0:
+            raise ValueError('nside must not be larger than the NSIDE of the '
+                             'associations', nside, self.nside)
+        npix = hp.nside2npix(nside)
+        # pairs of rows and ancestors without repetitions, ordered by row
+        keys = np.unique(self.rowdata.astype(np.int64) * npix +
+                         parents(self.coldata, k))
+        coarse = copy.copy(self)
+        coarse.nside = nside
+        coarse._rowdata, coarse._coldata = keys // npix, keys % npix
+        coarse._spmat = None
+        coarse._cscmat = None
+        return coarse
+
+
+class HealPixelizedOpSimPyramid(object):
+    """
+    Associations of OpSim pointings and healpix tiles at several NSIDEs,
+    computed by querying discs at the finest NSIDE only. The associations at
+    the coarser NSIDEs are derived by `HealPixelizedOpSim.atNside`.
+
+    Parameters
+    ----------
+    hpOpSim : `HealPixelizedOpSim`
+        associations at the finest NSIDE, in the NESTED scheme
+    nsides : sequence of int
+        NSIDEs of the levels, which must not be larger than `hpOpSim.nside`
+
+    Example
+    -------
+    >>> pyramid = HealPixelizedOpSimPyramid.fromOpSimDF(opsimdf, (64, 256))
+    >>> pyramid.obsHistIdsForTile(100, nside=64)
+    """
+    def __init__(self, hpOpSim, nsides):
+        nsides = sorted(set(int(nside) for nside in nsides) |
+                        set((int(hpOpSim.nside),)))
+        self.levels = dict()
+        for nside in nsides:
+            if nside == hpOpSim.nside:
+                self.levels[nside] = hpOpSim
+            else:
+                self.levels[nside] = hpOpSim.atNside(nside)
+
+    @classmethod
+    def fromOpSimDF(cls, opsimDF, nsides, **kwargs):
+        """
+        pyramid of the OpSim records `opsimDF` at the NSIDEs `nsides`, where
+        `kwargs` are the other parameters of `HealPixelizedOpSim`
+        """
+        hpOpSim = HealPixelizedOpSim(opsimDF, NSIDE=max(nsides), **kwargs)
+        return cls(hpOpSim, nsides)
+
+    @property
+    def nsides(self):
+        return sorted(self.levels)
+
+    def __getitem__(self, nside):
+        if nside not in self.levels:
+            raise ValueError('no associations at nside', nside)
+        return self.levels[nside]
+
+    def obsHistIdsForTile(self, tileID, nside):
+        """
+        `np.ndarray` of obsHistID values that intersect with the healpix
+        tileID at NSIDE `nside`
+        """
+        return self[nside].obsHistIdsForTile(tileID)
+
+    def obsHistIdsForTiles(self, tileIDs, nside):
+        """
+        obsHistID values that intersect with each of the healpix `tileIDs` at
+        NSIDE `nside`, as described in `HealPixelizedOpSim.obsHistIdsForTiles`
+        """
+        return self[nside].obsHistIdsForTiles(tileIDs)
+
+    def writeToNpy(self, directory):
+        """
+        Write the associations at each NSIDE to the subdirectory
+        `nside_<NSIDE>` of `directory` with `HealPixelizedOpSim.writeToNpy`,
+        and the NSIDEs to a file `metadata.json`.
+        """
+        for (nside, hpOpSim) in self.levels.items():
+            hpOpSim.writeToNpy(os.path.join(directory,
+                                            'nside_{}'.format(nside)))
+        with open(os.path.join(directory, 'metadata.json'), 'w') as fh:
+            json.dump(dict(NSIDES=self.nsides), fh)
+
+    @classmethod
+    def fromNpy(cls, directory, mmap=True):
+        """
+        pyramid written by `writeToNpy` to `directory`, with the arrays
+        memory mapped if `mmap`
+        """
+        with open(os.path.join(directory, 'metadata.json')) as fh:
+            nsides = json.load(fh)['NSIDES']
+        pyramid = cls.__new__(cls)
+        pyramid.levels = dict((nside, HealPixelizedOpSim.fromNpy(
+            os.path.join(directory, 'nside_{}'.format(nside)), mmap=mmap))
+                              for nside in nsides)
+        return pyramid
+
@@ -144,7 +144,12 @@ class HealpixTiles(Tiling):
                                                     pointingRadius=fovRadius)
 
     def _tileFromHpOpSim(self, pointing):
-        return self.hpOpSim.set_index('obsHistID').ix(pointing)['hids']
+        rows = np.flatnonzero(self.hpOpSim.opsimdf.obsHistID.values ==
+                              pointing)
+        if len(rows) == 0:
+            raise ValueError('pointing not in hpOpSim', pointing)
+        spmat = self.hpOpSim.sparseMat
+        return spmat.indices[spmat.indptr[rows[0]]:spmat.indptr[rows[0] + 1]]
 
     def _tileFromPreComputedDB(self, pointing, tableName='simlib'):
         sql = 'SELECT ipix FROM {0} WHERE obsHistID == {1}'\
@@ -160,7 +165,7 @@ class HealpixTiles(Tiling):
             return self._tileFromPreComputedDB(
                 self, pointing, tableName='simlib')
         elif self.hpOpSim is not None:
-            return self._tileFromHpOpSim(self, pointing)
+            return self._tileFromHpOpSim(pointing)
         else:
             raise ValueError(
                 'both attributes preComputedMap and hpOpSim cannot'
@@ -207,14 +207,39 @@ class LightCurve(BaseLightCurve):
         _lc = self._lightCurve.copy()
 
         # return the light curve
-        _lc.band = _lc.band.apply(lambda x: x.decode())
-        _lc.band = _lc.band.apply(lambda x: x.strip())
-        if self.bandNameDict is not None:
-            _lc.band = _lc.band.apply(lambda x:
-                                      self.remap_filters(x, self.bandNameDict,
-                                                    self.ignore_case))
+        _lc['band'] = self.standardBandNames(_lc.band, self.bandNameDict,
+                                             self.ignore_case)
         return _lc
 
+    @classmethod
+    def standardBandNames(cls, bands, bandNameDict=None, ignore_case=True):
+        """
+        return an array of band names decoded (if bytes), stripped of white
+        space and remapped using `bandNameDict` if not None. The
+        transformations are applied only to the distinct values of `bands`.
+
+        Parameters
+        ----------
+        bands : `pd.Series` or `np.ndarray`
+            band names
+        bandNameDict : dictionary, defaults to None
+            dictionary used to remap the band names through `remap_filters`
+        ignore_case : Bool, defaults to True
+            ignore case of band names in remapping
+        """
+        def standardName(x):
+            if isinstance(x, bytes):
+                x = x.decode()
+            x = x.strip()
+            if bandNameDict is not None:
+                x = cls.remap_filters(x, bandNameDict, ignore_case)
+            return x
+
+        codes, uniques = pd.factorize(bands)
+        names = np.array(list(standardName(x) for x in uniques) + [np.nan],
+                         dtype=object)
+        return names[codes]
+
     def snCosmoLC(self, coaddTimes=None, mjdBefore=0., minmjd=None):
         lc = self.coaddedLC(coaddTimes=coaddTimes, mjdBefore=mjdBefore,
                             minmjd=minmjd).rename(columns=dict(mjd='time'))
@@ -223,13 +248,23 @@ class LightCurve(BaseLightCurve):
         return Table.from_pandas(lc)
 
     @staticmethod
-    def sanitize_nan(lcs):
+    def sanitize_nan(lcs, inplace=False):
         """
+        replace nans in `flux` by 0. and nans in `fluxerr` by the mean of
+        `fluxerr`
+
+        Parameters
+        ----------
+        lcs : `pd.DataFrame`
+            light curve or photometry table
+        inplace : Bool, defaults to False
+            if True, `lcs` is modified in place rather than copied
+
         .. note:: These methods are meant to be applied to photometric tables
         as well
         """
-        
-        lcs = lcs.copy()
+        if not inplace:
+            lcs = lcs.copy()
         # Stop gap measure to deal with nans
         avg_error  = lcs.fluxerr.mean(skipna=True)
         lcs.fillna(dict(flux=0., fluxerr=avg_error), inplace=True)
@@ -274,7 +309,9 @@ class LightCurve(BaseLightCurve):
                           additionalColsKept=None,
                           additionalAggFuncs='first',
                           keepAll=False,
-                          keepCounts=True):
+                          keepCounts=True,
+                          groupIndex=None,
+                          avg_cols=None):
         """
         Parameters
         ----------
@@ -282,6 +319,14 @@ class LightCurve(BaseLightCurve):
         include_snid :
         cols :
         additionalAvgCols : list of strings
+        groupIndex : `GroupIndex`, defaults to None
+            precomputed grouping of the rows of `preProcessedlcs` by
+            (`snid`, `band`, `night`), used instead of grouping the keys
+            again
+        avg_cols : list of strings, defaults to None
+            columns whose weighted averages are computed, which must have
+            been weighted by `add_weightedColumns`. If None, `mjd`, `flux`
+            and `zp`.
         
         .. note:: These methods are meant to be applied to photometric tables
         as well
@@ -291,8 +336,11 @@ class LightCurve(BaseLightCurve):
             grouping = ['snid'] + grouping
  
         default_avg_cols = ['mjd', 'flux', 'zp']
-        avg_cols = default_avg_cols
-        
+        if avg_cols is None:
+            avg_cols = default_avg_cols
+        else:
+            avg_cols = list(col for col in avg_cols if col != 'fluxerr')
+
         if additionalAvgCols is not None:
             avg_cols += additionalAvgCols
             
@@ -302,7 +350,14 @@ class LightCurve(BaseLightCurve):
         
         
         #lcs = _preprocess(lcs, cols=cols, timeStep=timeStep, timeOffset=timeOffset)
-        grouped = lcs.groupby(grouping)
+        if groupIndex is None:
+            grouped = lcs.groupby(grouping)
+        else:
+            if list(groupIndex.names) != grouping:
+                raise ValueError('groupIndex does not group by', grouping)
+            groupIndex.checkRows(len(lcs))
+            grouped = lcs.groupby(groupIndex.grouper(), observed=True,
+                                  sort=True)
 
         aggdict = dict(('weighted_' + col, np.sum) for col in avg_cols)
         aggdict['weights'] = np.sum
@@ -343,6 +398,8 @@ class LightCurve(BaseLightCurve):
 
         
         x = grouped.agg(aggdict)
+        if groupIndex is not None:
+            x.index = groupIndex.labels(x.index)
     
         weighted_cols = list(col for col in x.reset_index().columns
                              if (col.startswith('weighted') and col != 'weighted_fluxerr') )
@@ -362,7 +419,8 @@ class LightCurve(BaseLightCurve):
                   grouping=('snid', 'band'),
                   summary_prefix='',
                   prefix_interpret='',
-                  useSNR=True):
+                  useSNR=True,
+                  groupIndex=None):
         """
         summarize a light curve of set of light curves using the functions
         `aggfunctions` to aggregate over the values in `vals` over groups
@@ -380,6 +438,9 @@ class LightCurve(BaseLightCurve):
         paramsdf : `pd.DataFrame`, defaults to None
             dataframe with one or more rows of truth parameters indexed by the
             snid.
+        groupIndex : `GroupIndex`, defaults to None
+            precomputed grouping of the rows of `lcdf` by `grouping`, used
+            instead of grouping the keys again
 
         .. note ::
         """
@@ -404,12 +465,23 @@ class LightCurve(BaseLightCurve):
             if not (fluxcol in lcdf.columns and fluxerrcol in lcdf.columns):
                 raise ValueError('The flux and flux error columns cannot be found to calculate SNR', fluxcol, fluxerrcol)
             lcdf['SNR'] = lcdf[fluxcol] / lcdf[fluxerrcol]
-        lcdf = lcdf.query('SNR > @SNRmin')
-
-        # single band light curves
-        grouped = lcdf.groupby(list(grouping))
         mapdict = dict(tuple(zip(vals, aggfuncs)))
-        summary = grouped.agg(mapdict)
+        if groupIndex is None:
+            lcdf = lcdf.query('SNR > @SNRmin')
+
+            # single band light curves
+            grouped = lcdf.groupby(list(grouping))
+            summary = grouped.agg(mapdict)
+        else:
+            if list(groupIndex.names) != list(grouping):
+                raise ValueError('groupIndex does not group by', grouping)
+            groupIndex.checkRows(len(lcdf))
+            sel = (lcdf['SNR'] > SNRmin).values
+            lcdf = lcdf[sel]
+            grouped = lcdf.groupby(groupIndex.grouper(sel), observed=True,
+                                   sort=True)
+            summary = grouped.agg(mapdict)
+            summary.index = groupIndex.labels(summary.index)
 
         # Check for variables to unstack
         unstackvars = set(grouping) - set(('snid',))
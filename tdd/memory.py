@@ -0,0 +1,72 @@
+"""
+Global memory budget for operations on photometry tables. Operations whose
+estimated working set exceeds the budget are executed in chunks of objects,
+each of which fits in the budget.
+"""
+from __future__ import absolute_import, print_function, division
+import re
+import numpy as np
+
+__all__ = ['set_memory_budget', 'get_memory_budget', 'parse_memory_size',
+           'chunk_boundaries']
+
+_units = dict(b=1, kb=10**3, mb=10**6, gb=10**9, tb=10**12,
+              kib=2**10, mib=2**20, gib=2**30, tib=2**40)
+_memoryBudget = None
+
+
+def parse_memory_size(size):
+    """
+    number of bytes in `size`, which is either a number of bytes or a string
+    like '8GB', '512 MB' or '1.5GiB' (decimal units kB, MB, GB, TB and
+    binary units KiB, MiB, GiB, TiB)
+    """
+    if size is None:
+        return None
+    if not isinstance(size, str):
+        return int(size)
+    match = re.match(r'^\s*([0-9.]+)\s*([a-zA-Z]*)\s*$', size)
+    unit = match.group(2).lower() if match is not None else None
+    if unit != '' and unit not in _units:
+        raise ValueError('cannot interpret memory size', size)
+    return int(float(match.group(1)) * _units.get(unit, 1))
+
+
+def set_memory_budget(budget):
+    """
+    set the memory budget used by `PhotTables.coaddedTable` and
+    `PhotTables.summary` to `budget` (bytes, or a string like '8GB').
+    If None, the budget is removed.
+    """
+    global _memoryBudget
+    budget = parse_memory_size(budget)
+    if budget is not None and budget <= 0:
+        raise ValueError('memory budget must be positive', budget)
+    _memoryBudget = budget
+
+
+def get_memory_budget():
+    """
+    memory budget in bytes, or None if there is no budget
+    """
+    return _memoryBudget
+
+
+def chunk_boundaries(sizes, numChunks):
+    """
+    split a sequence of objects with `sizes` rows into at most `numChunks`
+    consecutive chunks of about equal numbers of rows. Objects are not
+    split across chunks.
+
+    Returns
+    -------
+    `np.ndarray` of the indices of the first object of each chunk, followed
+    by the number of objects
+    """
+    sizes = np.asarray(sizes)
+    if len(sizes) == 0:
+        return np.zeros(1, dtype=np.int64)
+    ends = np.cumsum(sizes)
+    targets = ends[-1] * np.arange(1, numChunks) / numChunks
+    bounds = np.searchsorted(ends, targets, side='left') + 1
+    return np.unique(np.concatenate(([0], bounds, [len(sizes)])))
@@ -0,0 +1,194 @@
+"""
+Multi-Order Coverage maps (MOC) of regions of the sky (survey footprints,
+DDF fields, masks), represented as sorted disjoint ranges of NESTED healpix
+pixel ids at the maximal order 29 (NSIDE = 2**29). A region made of pixels
+at any NSIDE is stored as few ranges however fine the pixels, and set
+operations and membership tests are computed on the ranges.
+"""
+from __future__ import absolute_import, print_function, division
+import numpy as np
+import healpy as hp
+from .nested import (nside_to_order, merge_ranges, pixels_to_ranges,
+                     in_ranges, ragged_arange)
+
+__all__ = ['MOC']
+
+MAX_ORDER = 29
+
+
+class MOC(object):
+    """
+    Multi-Order Coverage map stored as sorted disjoint half open ranges
+    [starts, ends) of NESTED healpix pixel ids at order 29
+
+    Parameters
+    ----------
+    starts : `np.ndarray` of int
+        starts of the ranges
+    ends : `np.ndarray` of int
+        ends of the ranges. The ranges need not be sorted or disjoint.
+    """
+    def __init__(self, starts=(), ends=()):
+        self.starts, self.ends = merge_ranges(starts, ends)
+
+    @classmethod
+    def fromPixels(cls, ipix, nside):
+        """
+        MOC of the NESTED healpix pixels `ipix` at NSIDE=`nside`
+        """
+        k = MAX_ORDER - nside_to_order(nside)
+        return cls(*pixels_to_ranges(ipix, k))
+
+    @classmethod
+    def fromUniq(cls, uniq):
+        """
+        MOC of the cells with NUNIQ ids `uniq` (4 * 4**order + ipix)
+        """
+        uniq = np.asarray(uniq, dtype=np.int64)
+        # 4**(order + 1) <= uniq < 4**(order + 2), in integers since log2
+        # rounds up close to the powers of 4 at deep orders
+        order = np.searchsorted(4**np.arange(1, MAX_ORDER + 2, dtype=np.int64),
+                                uniq, side='right') - 1
+        ipix = uniq - np.left_shift(4, 2 * order)
+        shift = 2 * (MAX_ORDER - order)
+        return cls(np.left_shift(ipix, shift), np.left_shift(ipix + 1, shift))
+
+    @classmethod
+    def fromHealPixelizedOpSim(cls, hpOpSim, obsHistIDs=None):
+        """
+        MOC of the tiles of `hpOpSim` (`HealPixelizedOpSim`) associated with
+        the pointings `obsHistIDs`, or any pointing if None. Tiles in the
+        RING scheme are converted to the NESTED scheme.
+        """
+        cols = hpOpSim.coldata
+        if obsHistIDs is not None:
+            rows = np.flatnonzero(np.isin(hpOpSim.opsimdf.obsHistID.values,
+                                          obsHistIDs))
+            cols = hpOpSim.sparseMat[rows].indices
+        cols = np.unique(cols)
+        if not hpOpSim.nest:
+            cols = hp.ring2nest(hpOpSim.nside, cols)
+        return cls.fromPixels(cols, hpOpSim.nside)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __eq__(self, other):
+        return np.array_equal(self.starts, other.starts) and \
+            np.array_equal(self.ends, other.ends)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'MOC({0} ranges, {1:.4g} sq deg)'.format(len(self),
+                                                        self.area())
+
+    @property
+    def nbytes(self):
+        return self.starts.nbytes + self.ends.nbytes
+
+    def area(self, degrees=True):
+        """
+        area covered, in square degrees if `degrees` else steradians
+        """
+        npix = np.sum(self.ends - self.starts)
+        area = npix * 4 * np.pi / (12. * 4.**MAX_ORDER)
+        return area * np.degrees(1.)**2 if degrees else area
+
+    def _combine(self, other, select):
+        # coverage of each set between consecutive range boundaries
+        positions = np.concatenate((self.starts, self.ends,
+                                    other.starts, other.ends))
+        nself, nother = len(self.starts), len(other.starts)
+        dself = np.concatenate((np.ones(nself), -np.ones(nself),
+                                np.zeros(2 * nother)))
+        dother = np.concatenate((np.zeros(2 * nself), np.ones(nother),
+                                 -np.ones(nother)))
+        positions, inverse = np.unique(positions, return_inverse=True)
+        inverse = inverse.ravel()
+        covself = np.cumsum(np.bincount(inverse, weights=dself,
+                                        minlength=len(positions)))
+        covother = np.cumsum(np.bincount(inverse, weights=dother,
+                                         minlength=len(positions)))
+        keep = np.flatnonzero(select(covself[:-1] > 0, covother[:-1] > 0))
+        return self.__class__(positions[keep], positions[keep + 1])
+
+    def union(self, other):
+        return self.__class__(np.concatenate((self.starts, other.starts)),
+                              np.concatenate((self.ends, other.ends)))
+
+    def intersection(self, other):
+        return self._combine(other, lambda a, b: a & b)
+
+    def difference(self, other):
+        return self._combine(other, lambda a, b: a & ~b)
+
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+
+    def containsPixels(self, ipix, nside):
+        """
+        boolean array of whether the NESTED pixels `ipix` at NSIDE=`nside`
+        are entirely in the MOC
+        """
+        shift = 2 * (MAX_ORDER - nside_to_order(nside))
+        ipix = np.asarray(ipix, dtype=np.int64)
+        if len(self) == 0:
+            return np.zeros(ipix.shape, dtype=bool)
+        idx = np.searchsorted(self.starts, np.left_shift(ipix, shift),
+                              side='right') - 1
+        return (idx >= 0) & \
+            (self.ends[np.maximum(idx, 0)] >= np.left_shift(ipix + 1, shift))
+
+    def contains(self, ra, dec):
+        """
+        boolean array of whether the points (`ra`, `dec`) in degrees are in
+        the MOC
+        """
+        theta = - np.radians(np.ravel(dec)) + np.pi / 2.
+        phi = np.radians(np.ravel(ra))
+        ipix = hp.ang2pix(2**MAX_ORDER, theta, phi, nest=True)
+        return in_ranges(ipix, self.starts, self.ends)
+
+    def toPixels(self, nside, fully=False):
+        """
+        sorted NESTED ids of the pixels at NSIDE=`nside` that intersect the
+        MOC, or if `fully`, that are entirely in the MOC. These are the tile
+        sets used by `HealpixTiles` and `HealPixelizedOpSim`.
+        """
+        shift = 2 * (MAX_ORDER - nside_to_order(nside))
+        if fully:
+            first = np.right_shift(self.starts + (1 << shift) - 1, shift)
+            last = np.right_shift(self.ends, shift)
+        else:
+            first = np.right_shift(self.starts, shift)
+            last = np.right_shift(self.ends - 1, shift) + 1
+        return np.unique(ragged_arange(first, last))
+
+    def toUniq(self):
+        """
+        sorted NUNIQ ids (4 * 4**order + ipix) of the coarsest cells making
+        up the MOC
+        """
+        starts, ends = self.starts, self.ends
+        uniq = []
+        for order in range(MAX_ORDER + 1):
+            if len(starts) == 0:
+                break
+            shift = 2 * (MAX_ORDER - order)
+            first = np.right_shift(starts + (1 << shift) - 1, shift)
+            last = np.right_shift(ends, shift)
+            cells = ragged_arange(first, last)
+            uniq.append(cells + np.left_shift(4, 2 * order))
+            # the parts of the ranges not covered by cells of this order
+            full = last > first
+            starts, ends = merge_ranges(
+                np.concatenate((starts[~full], starts[full],
+                                np.left_shift(last[full], shift))),
+                np.concatenate((ends[~full], np.left_shift(first[full], shift),
+                                ends[full])))
+        if len(uniq) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate(uniq))
@@ -0,0 +1,142 @@
+"""
+Hierarchy of healpix pixels in the NESTED scheme through bit arithmetic. At
+NSIDE = 2**order, the ids of the 4**k descendants of a pixel `ipix` at
+NSIDE * 2**k are the contiguous range [ipix << 2k, (ipix + 1) << 2k), and the
+id of its ancestor at NSIDE / 2**k is ipix >> 2k. All functions operate on
+arrays of pixel ids without loops over pixels.
+"""
+from __future__ import absolute_import, print_function, division
+import numpy as np
+
+__all__ = ['nside_to_order', 'order_to_nside', 'children', 'parents',
+           'change_nside', 'descendant_ranges', 'merge_ranges',
+           'pixels_to_ranges', 'in_ranges', 'ragged_arange']
+
+
+def nside_to_order(nside):
+    """
+    order (log2 of `nside`) of the healpix NSIDE `nside`, which must be a
+    power of 2
+    """
+    nside = int(nside)
+    if nside < 1 or nside & (nside - 1) != 0:
+        raise ValueError('nside must be a power of 2', nside)
+    return nside.bit_length() - 1
+
+
+def order_to_nside(order):
+    """
+    healpix NSIDE of the order `order`
+    """
+    return 1 << int(order)
+
+
+def _pixels(ipix, nside):
+    ipix = np.ravel(ipix).astype(np.int64)
+    if len(ipix) > 0 and (ipix.min() < 0 or ipix.max() >= 12 * nside**2):
+        raise ValueError('ipix out of range for nside', nside)
+    return ipix
+
+
+def children(ipix, k=1, nside=None):
+    """
+    ids of the 4**`k` descendants at NSIDE * 2**`k` of the pixels `ipix`,
+    as an array of size 4**`k` * len(`ipix`), ordered by pixel and then by
+    descendant id. If `nside` is not None, `ipix` are checked to be valid
+    pixel ids at `nside`.
+    """
+    ipix = _pixels(ipix, nside) if nside is not None \
+        else np.ravel(ipix).astype(np.int64)
+    offsets = np.arange(4**k, dtype=np.int64)
+    return (np.left_shift(ipix, 2 * k)[:, np.newaxis] + offsets).ravel()
+
+
+def parents(ipix, k=1):
+    """
+    ids of the ancestors at NSIDE / 2**`k` of the pixels `ipix`
+    """
+    return np.right_shift(np.asarray(ipix, dtype=np.int64), 2 * k)
+
+
+def change_nside(ipix, nside, newNside):
+    """
+    ids of the ancestors of `ipix` at NSIDE=`newNside` if `newNside` <=
+    `nside`, or of the first descendants otherwise (use `children` or
+    `descendant_ranges` for all of the descendants)
+    """
+    k = nside_to_order(newNside) - nside_to_order(nside)
+    ipix = np.asarray(ipix, dtype=np.int64)
+    if k < 0:
+        return parents(ipix, -k)
+    return np.left_shift(ipix, 2 * k)
+
+
+def descendant_ranges(ipix, k):
+    """
+    half open ranges [start, end) of the ids of the descendants at
+    NSIDE * 2**`k` of the pixels `ipix`
+
+    Returns
+    -------
+    tuple of `np.ndarray` (starts, ends)
+    """
+    ipix = np.asarray(ipix, dtype=np.int64)
+    return np.left_shift(ipix, 2 * k), np.left_shift(ipix + 1, 2 * k)
+
+
+def merge_ranges(starts, ends):
+    """
+    union of the half open ranges [starts, ends) as sorted, disjoint and
+    non adjacent ranges
+
+    Returns
+    -------
+    tuple of `np.ndarray` (starts, ends)
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    keep = ends > starts
+    starts, ends = starts[keep], ends[keep]
+    if len(starts) == 0:
+        return starts, ends
+    order = np.argsort(starts, kind='mergesort')
+    starts, ends = starts[order], np.maximum.accumulate(ends[order])
+    # a range begins where its start is beyond the end of all previous ones
+    newRange = np.append(True, starts[1:] > ends[:-1])
+    first = np.flatnonzero(newRange)
+    last = np.append(first[1:], len(starts)) - 1
+    return starts[first], ends[last]
+
+
+def pixels_to_ranges(ipix, k=0):
+    """
+    sorted disjoint ranges of the pixel ids at NSIDE * 2**`k` covered by the
+    pixels `ipix`
+    """
+    return merge_ranges(*descendant_ranges(np.ravel(ipix), k))
+
+
+def in_ranges(ipix, starts, ends):
+    """
+    boolean array of whether each of `ipix` is in one of the sorted,
+    disjoint half open ranges [starts, ends)
+    """
+    ipix = np.asarray(ipix, dtype=np.int64)
+    idx = np.searchsorted(starts, ipix, side='right') - 1
+    valid = idx >= 0
+    result = np.zeros(ipix.shape, dtype=bool)
+    result[valid] = ipix[valid] < np.asarray(ends)[idx[valid]]
+    return result
+
+
+def ragged_arange(first, last):
+    """
+    concatenation of `np.arange(first[i], last[i])` for all i
+    """
+    first = np.asarray(first, dtype=np.int64)
+    lengths = np.maximum(np.asarray(last, dtype=np.int64) - first, 0)
+    total = lengths.sum()
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.repeat(first - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(total, dtype=np.int64)
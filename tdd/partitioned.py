@@ -0,0 +1,287 @@
+"""
+Photometry tables too large to be held in memory, stored on disk in
+partitions obtained by hashing `snid`. Since all of the photometry of an
+object is in a single partition, the operations of `PhotTables` grouping by
+`snid` are computed independently on each partition, in a process pool, and
+the results are combined into the result for the whole table.
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import glob
+import json
+import multiprocessing
+import numpy as np
+import pandas as pd
+from .aliases import alias_dict as aliasDictionary
+from .lightcurve import LightCurve
+from .photometry import PhotTables
+from .pipeline import concat_summaries
+
+__all__ = ['partition_index', 'PartitionWriter', 'PartitionedPhotTables']
+
+
+def partition_index(snid, numPartitions):
+    """
+    index of the partition of each value of `snid` among `numPartitions`
+    partitions, from a stable hash of the values, so that structured
+    integer IDs (eg. multiples of `numPartitions`) are spread among the
+    partitions.
+    """
+    snid = np.asarray(snid)
+    if snid.dtype.kind in ('i', 'u'):
+        # the same for IDs read with different integer types
+        hashed = pd.util.hash_array(snid.astype(np.int64))
+    else:
+        hashed = pd.util.hash_array(snid.astype(object))
+    return (hashed % np.uint64(numPartitions)).astype(np.int64)
+
+
+class PartitionWriter(object):
+    """
+    Write photometry, supplied as a sequence of `pd.DataFrame` chunks with
+    arbitrary row orders, into `numPartitions` partitions on disk hashed on
+    `snid`. Each chunk is split among the partitions and appended as a new
+    file, so that only a chunk is held in memory.
+
+    Parameters
+    ----------
+    directory : string
+        directory of the partitions, created if it does not exist
+    numPartitions : int, defaults to 16
+        number of partitions
+    overwrite : Bool, defaults to False
+        if True, partitions written earlier to `directory` are removed.
+        Otherwise, a `ValueError` is raised if there are any.
+    """
+    def __init__(self, directory, numPartitions=16, overwrite=False):
+        self.directory = directory
+        self.numPartitions = numPartitions
+        self.numRows = 0
+        self.numChunks = 0
+        self._sumFluxerr = 0.
+        self._numFluxerr = 0
+        existing = glob.glob(os.path.join(directory, 'part_*', 'chunk_*.pkl'))
+        if len(existing) > 0:
+            if not overwrite:
+                raise ValueError('directory already holds partitions, use '
+                                 'overwrite=True to replace them', directory)
+            for fname in existing:
+                os.remove(fname)
+        for i in range(numPartitions):
+            pdir = self.partitionDirectory(i)
+            if not os.path.exists(pdir):
+                os.makedirs(pdir)
+
+    def partitionDirectory(self, i):
+        return os.path.join(self.directory, 'part_{:04d}'.format(i))
+
+    @staticmethod
+    def standardNames(df):
+        """
+        rename columns of `df` with aliases of the light curve columns to the
+        standard names
+        """
+        aliases = LightCurve.columnAliases.fget(None)
+        standardNamingDict = aliasDictionary(df.columns, aliases)
+        if len(standardNamingDict) > 0:
+            df = df.rename(columns=standardNamingDict)
+        return df
+
+    def write(self, df):
+        """
+        split the photometry `df` among the partitions and write it to disk
+        """
+        df = self.standardNames(df)
+        if len(df) == 0:
+            return
+        fluxerr = df['fluxerr'].values
+        self._sumFluxerr += np.nansum(fluxerr)
+        self._numFluxerr += np.sum(~np.isnan(fluxerr))
+
+        parts = partition_index(df['snid'].values, self.numPartitions)
+        order = np.argsort(parts, kind='mergesort')
+        parts = parts[order]
+        bounds = np.searchsorted(parts, np.arange(self.numPartitions + 1))
+        for i in range(self.numPartitions):
+            if bounds[i] == bounds[i + 1]:
+                continue
+            fname = os.path.join(self.partitionDirectory(i),
+                                 'chunk_{:06d}.pkl'.format(self.numChunks))
+            chunk = df.iloc[order[bounds[i]: bounds[i + 1]]]
+            chunk.reset_index(drop=True).to_pickle(fname)
+        self.numRows += len(df)
+        self.numChunks += 1
+
+    def close(self):
+        """
+        write the metadata of the partitions
+        """
+        meta = dict(numPartitions=self.numPartitions, numRows=self.numRows,
+                    meanFluxerr=(self._sumFluxerr / self._numFluxerr
+                                 if self._numFluxerr > 0 else np.nan))
+        with open(os.path.join(self.directory, 'metadata.json'), 'w') as fh:
+            json.dump(meta, fh)
+
+
+def _partitionResult(args):
+    """
+    evaluate the `PhotTables` method `method` on a partition, and either
+    return the result or write it to `outputFile` and return the file name
+    """
+    (fnames, fillValues, sanitize_nans, method, kwargs, outputFile) = args
+    if len(fnames) == 0:
+        return None
+    df = pd.concat(list(pd.read_pickle(fname) for fname in fnames),
+                   ignore_index=True)
+    if sanitize_nans:
+        df.fillna(fillValues, inplace=True)
+    photTable = PhotTables(df, sanitize_nans=False, copy=False,
+                           cacheEntries=0)
+    result = getattr(photTable, method)(**kwargs)
+    if outputFile is None:
+        return result
+    result.to_pickle(outputFile)
+    return outputFile
+
+
+class PartitionedPhotTables(object):
+    """
+    Photometry table stored on disk in partitions hashed on `snid`, with the
+    methods `coaddedTable` and `summary` of `PhotTables` computed partition
+    by partition.
+
+    Parameters
+    ----------
+    directory : string
+        directory written by `PartitionWriter`
+    sanitize_nans : Bool, defaults to True
+        if True, nans are replaced as in `LightCurve.sanitize_nan` with the
+        mean of `fluxerr` over the whole table
+    nproc : int, defaults to 1
+        number of processes over which partitions are distributed. The memory
+        of each process is bounded by the size of a partition.
+    """
+    def __init__(self, directory, sanitize_nans=True, nproc=1):
+        self.directory = directory
+        self.nan_sanitized = sanitize_nans
+        self.nproc = nproc
+        with open(os.path.join(directory, 'metadata.json')) as fh:
+            self.metadata = json.load(fh)
+        self.numPartitions = self.metadata['numPartitions']
+
+    @classmethod
+    def fromChunks(cls, chunks, directory, numPartitions=16,
+                   sanitize_nans=True, nproc=1, overwrite=False):
+        """
+        write a sequence of `pd.DataFrame` chunks of photometry to
+        `directory` and return the partitioned table. If `overwrite`,
+        partitions written earlier to `directory` are replaced.
+        """
+        writer = PartitionWriter(directory, numPartitions=numPartitions,
+                                 overwrite=overwrite)
+        for chunk in chunks:
+            writer.write(chunk)
+        writer.close()
+        return cls(directory, sanitize_nans=sanitize_nans, nproc=nproc)
+
+    @classmethod
+    def fromDataFrame(cls, df, directory, numPartitions=16,
+                      sanitize_nans=True, nproc=1, overwrite=False):
+        """
+        write the photometry `df` to `directory` and return the partitioned
+        table. If `overwrite`, partitions written earlier to `directory` are
+        replaced.
+        """
+        return cls.fromChunks((df,), directory, numPartitions=numPartitions,
+                              sanitize_nans=sanitize_nans, nproc=nproc,
+                              overwrite=overwrite)
+
+    def partitionFiles(self, i):
+        """
+        sorted list of files making up the partition `i`
+        """
+        pdir = os.path.join(self.directory, 'part_{:04d}'.format(i))
+        return sorted(glob.glob(os.path.join(pdir, 'chunk_*.pkl')))
+
+    def partition(self, i):
+        """
+        `pd.DataFrame` of the photometry in the partition `i`
+        """
+        fnames = self.partitionFiles(i)
+        if len(fnames) == 0:
+            return None
+        return pd.concat(list(pd.read_pickle(fname) for fname in fnames),
+                         ignore_index=True)
+
+    @property
+    def fillValues(self):
+        return dict(flux=0., fluxerr=self.metadata['meanFluxerr'])
+
+    def _map(self, method, kwargs, outputDir=None):
+        if outputDir is not None and not os.path.exists(outputDir):
+            os.makedirs(outputDir)
+        tasks = []
+        for i in range(self.numPartitions):
+            outputFile = None
+            if outputDir is not None:
+                outputFile = os.path.join(outputDir,
+                                          '{0}_{1:04d}.pkl'.format(method, i))
+            tasks.append((self.partitionFiles(i), self.fillValues,
+                          self.nan_sanitized, method, kwargs, outputFile))
+
+        if self.nproc > 1:
+            pool = multiprocessing.Pool(self.nproc)
+            try:
+                results = pool.map(_partitionResult, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = list(map(_partitionResult, tasks))
+        return list(res for res in results if res is not None)
+
+    def coaddedTable(self, outputDir=None, **kwargs):
+        """
+        `PhotTables.coaddedTable` of the whole table, accepting the same
+        keyword arguments.
+
+        Parameters
+        ----------
+        outputDir : string, defaults to None
+            if not None, the coadds of each partition are written to
+            `outputDir` and the list of file names is returned rather than
+            the concatenated table.
+        """
+        results = self._map('coaddedTable', kwargs, outputDir=outputDir)
+        if outputDir is not None:
+            return results
+        lcs = pd.concat(results, ignore_index=True)
+        keys = list(lcs.columns[:3])
+        return lcs.sort_values(keys, kind='mergesort').reset_index(drop=True)
+
+    def summary(self, outputDir=None, **kwargs):
+        """
+        `PhotTables.summary` of the whole table, accepting the same keyword
+        arguments.
+
+        Parameters
+        ----------
+        outputDir : string, defaults to None
+            if not None, the summaries of each partition are written to
+            `outputDir` and the list of file names is returned rather than
+            the concatenated table.
+        """
+        results = self._map('summary', kwargs, outputDir=outputDir)
+        if outputDir is not None:
+            return results
+
+        summary = concat_summaries(results)
+        intcols = list(col for col in summary.columns if 'obs' in col.lower())
+        summary[intcols] = summary[intcols].fillna(0)
+        if 'tileID' in summary.columns:
+            intcols += ['tileID']
+        try:
+            summary[intcols] = summary[intcols].astype(np.int64)
+        except:
+            pass
+        return summary
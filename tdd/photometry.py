@@ -4,7 +4,7 @@ Class for holding Photometry Tables
 from __future__ import absolute_import, print_function, division
 from future.utils import with_metaclass
 
-__all__ = ['PhotTables']
+__all__ = ['PhotTables', 'Photometry', 'PPIDIndex']
 
 import abc
 import numpy as np
@@ -12,6 +12,10 @@ import pandas as pd
 from astropy.table import Table
 from .aliases import alias_dict as aliasDictionary
 from .lightcurve import LightCurve
+from .caching import LRUCache, cachedMethod
+from .grouping import GroupIndex
+from .memory import get_memory_budget, chunk_boundaries
+from .pipeline import LazyPhotTable, concat_summaries
 
 class PhotTables(object):
     """
@@ -19,7 +23,8 @@ class PhotTables(object):
     curves. The minimal requirement is that this has all the columns of a
     supernova light curve, but also an index to identify the SN.
     """
-    def __init__(self, df, sanitize_nans=True):
+    def __init__(self, df, sanitize_nans=True, copy=True, cacheEntries=16,
+                 cacheBytes=None):
         """
         Instantiate the photometry table
         Parameters
@@ -32,17 +37,162 @@ class PhotTables(object):
         sanitize_nans: `Bool`, defaults to True
             if `True`, `nans` in the table are replaced using
             `LightCurve.sanitize_nan`
-        """
+        copy: `Bool`, defaults to True
+            if `False`, the instance takes ownership of `df`, which is modified
+            in place (standardized names and bands, sanitized nans) instead of
+            being copied, and `coaddedTable` avoids materializing copies of the
+            table. This keeps the peak memory close to the size of `df`.
+        cacheEntries: int, defaults to 16
+            maximal number of results of `coaddedTable` and `summary` which
+            are memoized. If 0, results are not memoized.
+        cacheBytes: int, defaults to None
+            maximal total size in bytes of the memoized results. If None, the
+            size is not bounded.
+        """
+        self.version = 0
+        self.cache = LRUCache(maxEntries=cacheEntries, maxBytes=cacheBytes)
+        self._groupIndices = dict()
+        self.copy = copy
+        self.nan_sanitized = sanitize_nans
+
+        if not copy:
+            # standardized names, in place
+            LightCurve(df)
+            df['band'] = LightCurve.standardBandNames(df.band)
+            if self.nan_sanitized:
+                LightCurve.sanitize_nan(df, inplace=True)
+            self._lcs = df
+            self.lcs = df
+            return
+
         # standardized names
         self._lcs = LightCurve(df)
         self._lcs = self._lcs.lightCurve
-        self.nan_sanitized = sanitize_nans
         lcs = self._lcs.copy()
         if self.nan_sanitized:
             lcs = LightCurve.sanitize_nan(lcs)
         self.lcs = lcs
 
 
+    @property
+    def lcs(self):
+        """
+        `pd.DataFrame` of photometry. Setting it invalidates the memoized
+        results.
+        """
+        return self._phot
+
+    @lcs.setter
+    def lcs(self, value):
+        self._phot = value
+        self.markModified()
+
+    def markModified(self):
+        """
+        record that the photometry has been modified, so that memoized results
+        are no longer used. This must be called after modifying `lcs` in
+        place.
+        """
+        self.version += 1
+        self.cache.clear()
+        self._groupIndices.clear()
+
+    def groupIndex(self, keys=('snid', 'band'), timeOffset=0., timeStep=1.0):
+        """
+        `GroupIndex` of the photometry grouped by the columns `keys`, built
+        on first use and kept until the photometry is modified. The key
+        `night`, if not a column, is the time discretized as in
+        `LightCurve.discretize_time` with `timeOffset` and `timeStep`; such
+        an index depends on the time step and is built on every call rather
+        than kept.
+        """
+        keys = tuple(keys)
+        if keys in self._groupIndices:
+            return self._groupIndices[keys]
+        lcs = self.lcs
+        values = []
+        derived = False
+        for key in keys:
+            if key == 'night' and 'night' not in lcs.columns:
+                values.append(((lcs.mjd.values - timeOffset) //
+                               timeStep).astype(np.int64))
+                derived = True
+            else:
+                values.append(lcs[key].values)
+        groupIndex = GroupIndex(values, names=keys)
+        if not derived:
+            self._groupIndices[keys] = groupIndex
+        return groupIndex
+
+    @property
+    def cacheStats(self):
+        """
+        dictionary of statistics of the memoized results: hits, misses,
+        evictions, entries, nbytes
+        """
+        return self.cache.stats
+
+    def lazy(self, objectsPerChunk=10000):
+        """
+        return a `LazyPhotTable` on the photometry, which records a chain of
+        operations and executes them in a single pass over chunks of
+        `objectsPerChunk` objects.
+
+        Example
+        -------
+        >>> plan = photTable.lazy().sanitize_nan().filter_snr(3.)\
+                .discretize_time(timeStep=1.0).add_weightedColumns()\
+                .coadd().summarize()
+        >>> print(plan.explain())
+        >>> summary = plan.collect()
+        """
+        return LazyPhotTable(self.lcs, objectsPerChunk=objectsPerChunk)
+
+    def estimateWorkingSet(self, method):
+        """
+        estimated number of bytes of the temporary tables and arrays used by
+        the method `method` ('coaddedTable' or 'summary'), from the number
+        of rows and the dtypes of the photometry
+        """
+        numRows = len(self.lcs)
+        rowBytes = self.lcs.memory_usage(index=True).sum() / max(numRows, 1)
+        # group codes and permutations, and the weighted columns of coadds
+        coadd = numRows * (3 * 8 + 8 * 8)
+        if self.copy:
+            coadd += numRows * rowBytes
+        if method == 'coaddedTable':
+            return int(coadd)
+        # copy of the table, SNR, and the copy selected by SNR
+        return int(coadd + numRows * (2 * rowBytes + 8))
+
+    def _budgetedChunks(self, method):
+        """
+        list of arrays of the rows of chunks of objects, for which `method`
+        fits in the memory budget, or None if the whole table fits
+        """
+        budget = get_memory_budget()
+        if budget is None:
+            return None
+        numChunks = int(np.ceil(self.estimateWorkingSet(method) / budget))
+        if numChunks < 2:
+            return None
+        objects = self.groupIndex(('snid',))
+        bounds = chunk_boundaries(objects.sizes, numChunks)
+        if len(bounds) < 3:
+            return None
+        starts = np.append(objects.starts, len(objects.order))
+        return list(objects.order[starts[bounds[i]]: starts[bounds[i + 1]]]
+                    for i in range(len(bounds) - 1))
+
+    def _chunkedResults(self, method, chunks, kwargs):
+        results = []
+        for rows in chunks:
+            chunk = PhotTables(self.lcs.iloc[rows].reset_index(drop=True),
+                               sanitize_nans=False, copy=False,
+                               cacheEntries=0)
+            results.append(getattr(chunk, method)(**kwargs))
+        return results
+
     @property
     def mandatoryColumns(self):
         """
@@ -57,6 +207,7 @@ class PhotTables(object):
         reqd = set(['mjd', 'band', 'flux', 'fluxerr', 'zp', 'zpsys']).union(new)
         return reqd
 
+    @cachedMethod
     def coaddedTable(self, timeOffset=0., timeStep=1.0, 
                      avg_cols=('mjd', 'flux', 'fluxerr', 'zp'),
                      additionalAvgCols=None,
@@ -88,11 +239,38 @@ class PhotTables(object):
         prepend_colNames : string, defaults to 'coadd_'
             string to be prepended to column names aside from `snid`, if left
             as `None`, then no prepending will happen
+
+        .. note:: results are memoized in `self.cache`, and should not be
+        modified in place. If the working set exceeds the memory budget set by
+        `set_memory_budget`, the coadds are computed in chunks of objects.
         """
         include_snid = 'snid' in self.lcs.columns
         if not include_snid:
             raise ValueError('the photTable does not include a column for SNID\n')
 
+        chunks = self._budgetedChunks('coaddedTable')
+        if chunks is not None:
+            kwargs = dict(timeOffset=timeOffset, timeStep=timeStep,
+                          avg_cols=avg_cols,
+                          additionalAvgCols=additionalAvgCols,
+                          additionalColsKept=additionalColsKept,
+                          additionalAggFuncs=additionalAggFuncs,
+                          prepend_colNames=prepend_colNames)
+            results = self._chunkedResults('coaddedTable', chunks, kwargs)
+            return pd.concat(results, ignore_index=True)
+
+        if not self.copy:
+            lcs = self._coaddWithoutCopies(timeOffset=timeOffset,
+                                           timeStep=timeStep,
+                                           avg_cols=avg_cols,
+                                           additionalAvgCols=additionalAvgCols,
+                                           additionalColsKept=additionalColsKept)
+            if prepend_colNames is not None:
+                lcs.columns = list(col if col in ('snid', 'band')
+                                   else prepend_colNames + col
+                                   for col in lcs.columns)
+            return lcs
+
         lcs = self.lcs.copy()
         lcs = LightCurve.discretize_time(lcs, timeOffset=timeOffset, timeStep=timeStep)
         lcs = LightCurve.add_weightedColumns(lcs,
@@ -102,13 +280,17 @@ class PhotTables(object):
         weightedcols = list(avg_cols)
         if additionalAvgCols is not None:
             weightedcols += list(additionalAvgCols)
+        groupIndex = self.groupIndex(('snid', 'band', 'night'),
+                                     timeOffset=timeOffset, timeStep=timeStep)
  
         lcs = LightCurve.coaddpreprocessed(lcs, include_snid=include_snid,
                                            cols=weightedcols,
                                            additionalColsKept=additionalColsKept,
                                            additionalAggFuncs='first',
                                            keepAll=False,
-                                           keepCounts=True)
+                                           keepCounts=True,
+                                           groupIndex=groupIndex,
+                                           avg_cols=weightedcols)
         if prepend_colNames is not None:
             coldict = dict((col, prepend_colNames + col) for col in lcs.columns
                            if col not in  ('snid', 'band'))
@@ -116,6 +298,49 @@ class PhotTables(object):
 
         return lcs
 
+    def _coaddWithoutCopies(self, timeOffset=0., timeStep=1.0,
+                            avg_cols=('mjd', 'flux', 'fluxerr', 'zp'),
+                            additionalAvgCols=None,
+                            additionalColsKept=('tileID', 'fieldID', 'zpsys')):
+        """
+        Same result as `LightCurve.coaddpreprocessed` applied to the
+        photometry table after `LightCurve.discretize_time` and
+        `LightCurve.add_weightedColumns`, but computed with temporary arrays
+        for the weighted quantities over the groups of `groupIndex`, so that
+        neither the table nor the weighted columns are materialized.
+        """
+        lcs = self.lcs
+        groupIndex = self.groupIndex(('snid', 'band', 'night'),
+                                     timeOffset=timeOffset, timeStep=timeStep)
+        first = groupIndex.order[groupIndex.starts]
+
+        if 'weights' in lcs.columns:
+            weights = lcs.weights.values
+        else:
+            weights = 1.0 / lcs.fluxerr.values**2
+        sumw = groupIndex.sum(weights)
+
+        # fluxerr is not averaged, but computed from the weights
+        avg_cols = list(col for col in avg_cols if col != 'fluxerr')
+        if additionalAvgCols is not None:
+            avg_cols += list(additionalAvgCols)
+        keptcols = ['zpsys']
+        if additionalColsKept is not None:
+            keptcols += list(additionalColsKept)
+
+        columns = list((key, groupIndex.keyValues(key))
+                       for key in ('snid', 'band', 'night'))
+        columns += list((col, lcs[col].values[first]) for col in keptcols)
+        columns.append(('numExpinCoadd', groupIndex.sizes))
+        for col in avg_cols:
+            wsum = groupIndex.sum(weights * lcs[col].values)
+            columns.append((col, wsum / sumw))
+        columns.append(('fluxerr', 1.0 / np.sqrt(sumw)))
+
+        return pd.concat(list(pd.Series(vals, name=name)
+                              for (name, vals) in columns), axis=1)
+
+    @cachedMethod
     def summary(self,
                 coadd=True,
                 coaddTimeStep=1.0,
@@ -136,8 +361,24 @@ class PhotTables(object):
         paramsdf: `pd.DataFrame`, default to None
             contains truth and other metadata about the astrophysical object
             involved. if not `None`, it is joined to the summary  
-        """
-        summary = LightCurve.summarize(self.lcs, paramsdf=paramsdf)
+
+        .. note:: results are memoized in `self.cache` if `paramsdf` is None,
+        and should not be modified in place. If the working set exceeds the
+        memory budget set by `set_memory_budget`, the summary is computed in
+        chunks of objects.
+        """
+        chunks = self._budgetedChunks('summary')
+        if chunks is not None:
+            kwargs = dict(coadd=coadd, coaddTimeStep=coaddTimeStep,
+                          coaddTimeOffset=coaddTimeOffset, paramsdf=paramsdf)
+            results = self._chunkedResults('summary', chunks, kwargs)
+            summary = concat_summaries(results)
+            bands = sorted(self.lcs.band.unique(), key=len, reverse=True)
+            summary = summary[self._summaryColumnOrder(results, bands)]
+            return self._integerCounts(summary)
+
+        summary = LightCurve.summarize(self.lcs, paramsdf=paramsdf,
+                                       groupIndex=self.groupIndex())
         if coadd:
             tmp = self.coaddedTable(timeStep=coaddTimeStep,
                                     timeOffset=coaddTimeOffset,
@@ -146,7 +387,39 @@ class PhotTables(object):
             nightlySummary = LightCurve.summarize(tmp,
                                                   summary_prefix='coadd_')
             summary = summary.join(nightlySummary)
+        return self._integerCounts(summary)
 
+    @staticmethod
+    def _summaryColumnOrder(summaries, bands):
+        """
+        order of the union of the columns of summaries of chunks of objects,
+        which is the order of the summary of all of the objects: the columns
+        of each statistic are contiguous with the bands sorted, and the
+        statistics are in the order in which they appear in the chunks.
+        """
+        def split(col):
+            col = str(col)
+            for band in bands:
+                if col.endswith('_' + str(band)):
+                    return col[:-len(str(band)) - 1], str(band)
+            return col, ''
+
+        stats = []
+        for summary in summaries:
+            for col in summary.columns:
+                stat = split(col)[0]
+                if stat not in stats:
+                    stats.append(stat)
+        columns = list(pd.unique(np.array(list(col for summary in summaries
+                                               for col in summary.columns),
+                                          dtype=object)))
+        keys = list((stats.index(split(col)[0]), split(col)[1])
+                    for col in columns)
+        return list(columns[i] for i in sorted(range(len(columns)),
+                                               key=keys.__getitem__))
+
+    @staticmethod
+    def _integerCounts(summary):
         # Make sure that some dtypes are converted into ints 
         intcols = list(col for col in summary.columns if 'obs' in col.lower())
         summary[intcols] = summary[intcols].fillna(0)
@@ -160,6 +433,17 @@ class PhotTables(object):
         return summary
 
 
+# reductions computed over groups by `BasePhotometry.fastStatTable`, ignoring
+# nans as `groupby.agg` does for these callables
+_reductions = dict((func, name) for (name, funcs) in (
+    ('min', (min, np.min, np.amin, np.nanmin, pd.Series.min)),
+    ('max', (max, np.max, np.amax, np.nanmax, pd.Series.max)),
+    ('sum', (np.sum, np.nansum, pd.Series.sum)),
+    ('mean', (np.mean, np.nanmean, pd.Series.mean)),
+    ('std', (np.std, np.nanstd)),
+    ('len', (len,))) for func in funcs)
+
+
 class BasePhotometry(with_metaclass(abc.ABCMeta, object)):
     def __init__(self, lcs, maxObsHistID, singleLCProps):
         """
@@ -209,7 +493,8 @@ class BasePhotometry(with_metaclass(abc.ABCMeta, object)):
     def statTable(PropTuple, callableTuple,
                   grouped=None,
                   dataframe=None,
-                  groupTuple=None):
+                  groupTuple=None,
+                  groupIndex=None):
         """
         Parameters
         ----------
@@ -218,7 +503,15 @@ class BasePhotometry(with_metaclass(abc.ABCMeta, object)):
         grouped :
         dataframe :
         groupTuple :
-        """
+        groupIndex : `GroupIndex`, defaults to None
+            precomputed grouping of `dataframe` by (`snid`, `band`)
+        """
+        if groupTuple is None and groupIndex is not None:
+            groupTuple = groupIndex.names
+        if grouped is None and tuple(groupTuple) == ('snid', 'band'):
+            return BasePhotometry.fastStatTable(PropTuple, callableTuple,
+                                                dataframe,
+                                                groupIndex=groupIndex)
         if grouped is None:
             grouped = dataframe.groupby(list(groupTuple))
         callable_strings = list(s.__name__ for s in callableTuple)
@@ -228,6 +521,93 @@ class BasePhotometry(with_metaclass(abc.ABCMeta, object)):
         xx.columns = ['_'.join(col).strip() for col in xx.columns.values]
         return xx 
 
+    @staticmethod
+    def fastStatTable(PropTuple, callableTuple, dataframe, groupIndex=None):
+        """
+        Same as `statTable` for photometry grouped by (`snid`, `band`), but
+        computed by scattering the reductions of each property over the
+        groups into a preallocated array of shape
+        (number of snid, number of bands * number of statistics) rather than
+        through `pivot_table`. The reductions min, max, sum, mean and std
+        (ddof=0) of numpy, the builtins min, max and len, and the `pd.Series`
+        methods min, max, sum and mean are computed with `np.ufunc.reduceat`
+        ignoring nans; other callables (eg. `pd.Series.std`, with ddof=1) are
+        evaluated with `groupby.agg`.
+
+        Parameters
+        ----------
+        PropTuple : tuple of strings
+            column names of properties
+        callableTuple : tuple of callables
+            reductions applied to the properties in `PropTuple`
+        dataframe : `pd.DataFrame`
+            photometry with columns `snid`, `band` and those in `PropTuple`
+        groupIndex : `GroupIndex`, defaults to None
+            precomputed grouping of `dataframe` by (`snid`, `band`). If None,
+            it is computed.
+
+        Returns
+        -------
+        `pd.DataFrame` indexed by `snid` with columns `callable_prop_band`
+        """
+        if groupIndex is None:
+            groupIndex = GroupIndex.fromFrame(dataframe, ('snid', 'band'))
+        elif list(groupIndex.names) != ['snid', 'band']:
+            raise ValueError('groupIndex does not group by (snid, band)',
+                             groupIndex.names)
+        groupIndex.checkRows(len(dataframe))
+        (snids, bands) = groupIndex.levels
+        (groupSNID, groupBand) = groupIndex.levelCodes
+        numBands = len(bands)
+        order, starts, sizes = (groupIndex.order, groupIndex.starts,
+                                groupIndex.sizes)
+
+        names = list('_'.join((func.__name__, prop)) for (prop, func)
+                     in zip(PropTuple, callableTuple))
+        statIndex = np.argsort(names, kind='mergesort')
+        table = np.full((len(snids), len(names) * numBands), np.nan)
+
+        for (i, (prop, func)) in enumerate(zip(PropTuple, callableTuple)):
+            column = statIndex.tolist().index(i) * numBands + groupBand
+            if len(starts) == 0:
+                continue
+            name = _reductions.get(func)
+            if name == 'len':
+                table[groupSNID, column] = sizes
+                continue
+            if name is None:
+                vals = dataframe.groupby(groupIndex.grouper(), observed=True,
+                                         sort=True)[prop].agg(func)
+                table[groupSNID, column] = vals.values
+                continue
+
+            values = np.asarray(dataframe[prop], dtype=np.float64)[order]
+            isnan = np.isnan(values)
+            counts = np.add.reduceat(~isnan, starts)
+            if name == 'min':
+                vals = np.fmin.reduceat(values, starts)
+            elif name == 'max':
+                vals = np.fmax.reduceat(values, starts)
+            else:
+                vals = np.add.reduceat(np.where(isnan, 0., values), starts)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    if name in ('mean', 'std'):
+                        vals = vals / counts
+                    if name == 'std':
+                        dev = values - np.repeat(vals, sizes)
+                        dev[isnan] = 0.
+                        vals = np.sqrt(np.add.reduceat(dev**2, starts)
+                                       / counts)
+            table[groupSNID, column] = vals
+
+        columns = list('_'.join((names[j], str(band))) for j in statIndex
+                       for band in bands)
+        xx = pd.DataFrame(table, columns=columns,
+                          index=pd.Index(snids, name='snid'))
+        # like pivot_table, drop rows and columns that are all nans
+        allnan = np.isnan(table)
+        return xx.loc[~allnan.all(axis=1), ~allnan.all(axis=0)]
+
     @abc.abstractmethod
     def pair_method(self, obsHistID, snid, maxObsHistID):
         """
@@ -235,20 +615,276 @@ class BasePhotometry(with_metaclass(abc.ABCMeta, object)):
         """
         pass
 
+class _ColumnBuffer(object):
+    """
+    Growable one dimensional array, whose capacity is doubled when full so
+    that appending n values in total costs O(n).
+    """
+    def __init__(self, dtype, capacity=16):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def values(self):
+        """
+        view of the values in the buffer
+        """
+        return self._data[:self._size]
+
+    def extend(self, values):
+        values = np.asarray(values)
+        if values.dtype.kind in ('U', 'S'):
+            values = values.astype(object)
+        dtype = np.result_type(self._data.dtype, values.dtype)
+        newSize = self._size + len(values)
+        if newSize > len(self._data) or dtype != self._data.dtype:
+            capacity = len(self._data)
+            while capacity < newSize:
+                capacity *= 2
+            data = np.empty(capacity, dtype=dtype)
+            data[:self._size] = self._data[:self._size]
+            self._data = data
+        self._data[self._size:newSize] = values
+        self._size = newSize
+
+
+class PPIDIndex(object):
+    """
+    Index of photometry rows by `PPID` values, where `PPID` is obtained
+    through `Photometry.pair_method` as `snid * maxObsHistID + obsHistID`.
+    The `PPID` values are sorted along with a permutation to the rows, and
+    a secondary permutation sorts the rows by `obsHistID`, so that all
+    lookups are binary searches through `np.searchsorted`.
+
+    Parameters
+    ----------
+    ppid : `np.ndarray` of integers
+        `PPID` values of the photometry rows
+    maxObsHistID : int
+        max value of obsHistID used to calculate `ppid`
+
+    .. note:: Batch lookups return a tuple (rows, offsets) of integer arrays,
+    where the rows matching the ith query are `rows[offsets[i]:offsets[i+1]]`.
+    """
+    def __init__(self, ppid, maxObsHistID):
+        ppid = np.asarray(ppid, dtype=np.int64)
+        self.maxObsHistID = maxObsHistID
+        self.order = np.argsort(ppid, kind='mergesort')
+        self.sortedPPID = ppid[self.order]
+        obsHistID = np.mod(ppid, maxObsHistID)
+        self.obsHistIDOrder = np.argsort(obsHistID, kind='mergesort')
+        self.sortedObsHistID = obsHistID[self.obsHistIDOrder]
+
+    def __len__(self):
+        return len(self.sortedPPID)
+
+    @staticmethod
+    def _ragged(permutation, lo, hi):
+        counts = hi - lo
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        positions = np.repeat(lo - offsets[:-1], counts) + \
+            np.arange(offsets[-1])
+        return permutation[positions], offsets
+
+    def rowsForSNID(self, snid):
+        """
+        rows of the photometry for each of the objects with IDs `snid`
+
+        Parameters
+        ----------
+        snid : int or `np.ndarray` of ints
+            object IDs
+        """
+        snid = np.ravel(snid).astype(np.int64)
+        lo = np.searchsorted(self.sortedPPID, snid * self.maxObsHistID)
+        hi = np.searchsorted(self.sortedPPID, (snid + 1) * self.maxObsHistID)
+        return self._ragged(self.order, lo, hi)
+
+    def rowsForObsHistID(self, obsHistID):
+        """
+        rows of the photometry for each of the pointings with IDs `obsHistID`
+
+        Parameters
+        ----------
+        obsHistID : int or `np.ndarray` of ints
+            pointing IDs
+        """
+        obsHistID = np.ravel(obsHistID).astype(np.int64)
+        lo = np.searchsorted(self.sortedObsHistID, obsHistID, side='left')
+        hi = np.searchsorted(self.sortedObsHistID, obsHistID, side='right')
+        return self._ragged(self.obsHistIDOrder, lo, hi)
+
+    def rowsForPairs(self, snid, obsHistID):
+        """
+        rows of the photometry for each of the pairs (`snid`, `obsHistID`)
+
+        Parameters
+        ----------
+        snid : int or `np.ndarray` of ints
+            object IDs
+        obsHistID : int or `np.ndarray` of ints
+            pointing IDs, of the same size as `snid`
+        """
+        ppid = Photometry.pair_method(np.ravel(obsHistID).astype(np.int64),
+                                      np.ravel(snid).astype(np.int64),
+                                      self.maxObsHistID)
+        lo = np.searchsorted(self.sortedPPID, ppid, side='left')
+        hi = np.searchsorted(self.sortedPPID, ppid, side='right')
+        return self._ragged(self.order, lo, hi)
+
+
 class Photometry(BasePhotometry):
     def __init__(self,
                  lcs,
                  maxObsHistID=10000000,
                  singleLCProps=None):
         """
+        Parameters
+        ----------
+        lcs : `pd.DataFrame`
+            photometry of one or more light curves. A named index (eg. `PPID`)
+            is converted to a column. If the columns `snid` and `obsHistID`
+            are present, the column `PPID` is calculated with `pair_method`.
+        maxObsHistID : int, defaults to 10000000
+            max value of obsHistID used in `pair_method`
+        singleLCProps : tuple of strings, defaults to None
+            properties of single light curves
+
+        .. note:: the columns are held in buffers of growing capacity, so that
+        the photometry may be grown through `append` in time linear in the
+        total number of rows.
         """
-        self._lcs = lcs.reset_index()
         if singleLCProps is None:
             self._singleLCProperties = ('ModelFlux', 'SNR')
         else:
             self._singleLCProperties = singleLCProps
         self.maxObsHistID = maxObsHistID
 
+        self._columns = None
+        self._numRows = 0
+        self._numPPIDRows = 0
+        self._lightCurve = None
+        self._ppidIndex = None
+        self._groupIndices = dict()
+        self.append(lcs, recalculatePPID=True)
+
+    def append(self, lcs, recalculatePPID=True):
+        """
+        given a dataframe representing a single or multiple
+        `LightCurve.lightCurve` objects, add it as new rows
+        to the photometry.
+
+        Parameters
+        ----------
+        lcs : dataframe representing single or multiple lightcurves, with the
+            same columns as the photometry (aside from `PPID`)
+        recalculatePPID : Bool, defaults to True
+            if True, calculates `PPID` for the new rows and any rows appended
+            earlier with `recalculatePPID=False`. Otherwise, the calculation is
+            deferred to a later call to `append` or `calculatePPID`, which is
+            useful when appending many small batches.
+        """
+        if lcs.index.name is not None or isinstance(lcs.index, pd.MultiIndex):
+            lcs = lcs.reset_index()
+
+        hasPair = 'snid' in lcs.columns and 'obsHistID' in lcs.columns
+        if self._columns is None:
+            self._columns = dict()
+            self._columnNames = list(lcs.columns)
+            if hasPair and 'PPID' not in self._columnNames:
+                self._columnNames.append('PPID')
+            for col in self._columnNames:
+                dtype = np.int64 if col == 'PPID' and hasPair \
+                    else np.asarray(lcs[col]).dtype
+                self._columns[col] = _ColumnBuffer(dtype=dtype,
+                                                   capacity=max(16, len(lcs)))
+            self._computesPPID = hasPair
+
+        required = set(self._columnNames)
+        columns = set(lcs.columns)
+        if self._computesPPID:
+            required.discard('PPID')
+            columns.discard('PPID')
+        if required != columns:
+            raise ValueError('columns do not match the photometry',
+                             required - columns, columns - required)
+
+        for col in self._columnNames:
+            if col == 'PPID' and self._computesPPID:
+                # placeholders, calculated below
+                self._columns[col].extend(np.full(len(lcs), -1,
+                                                  dtype=np.int64))
+            else:
+                self._columns[col].extend(np.asarray(lcs[col]))
+        self._numRows += len(lcs)
+        self._lightCurve = None
+        self._ppidIndex = None
+        self._groupIndices = dict()
+
+        if recalculatePPID:
+            self.calculatePPID()
+        return None
+
+    def calculatePPID(self):
+        """
+        calculate `PPID` for the rows for which it has not been calculated
+        """
+        if not self._computesPPID or self._numPPIDRows == self._numRows:
+            return None
+        start = self._numPPIDRows
+        snid = self._columns['snid'].values[start:]
+        obsHistID = self._columns['obsHistID'].values[start:]
+        self._columns['PPID'].values[start:] = \
+            self.pair_method(obsHistID, snid, self.maxObsHistID)
+        self._numPPIDRows = self._numRows
+        return None
+
+    def __len__(self):
+        return self._numRows
+
+    @property
+    def ppidIndex(self):
+        """
+        `PPIDIndex` of the photometry, built on first use after any `append`
+        """
+        if self._ppidIndex is None:
+            if not self._computesPPID:
+                raise ValueError('PPID requires the columns snid and '
+                                 'obsHistID')
+            self.calculatePPID()
+            self._ppidIndex = PPIDIndex(self._columns['PPID'].values,
+                                        self.maxObsHistID)
+        return self._ppidIndex
+
+    def groupIndex(self, keys=('snid', 'band')):
+        """
+        `GroupIndex` of the photometry grouped by the columns `keys`, built
+        on first use after any `append`. It may be passed to `statTable`
+        with `dataframe=self.lightCurve`.
+        """
+        keys = tuple(keys)
+        if keys not in self._groupIndices:
+            self._groupIndices[keys] = GroupIndex(
+                list(self._columns[key].values for key in keys), names=keys)
+        return self._groupIndices[keys]
+
+    @property
+    def lightCurve(self):
+        """
+        `pd.DataFrame` of the photometry, built from the column buffers
+        """
+        if self._lightCurve is None:
+            self.calculatePPID()
+            self._lightCurve = pd.DataFrame(
+                dict((col, self._columns[col].values)
+                     for col in self._columnNames),
+                columns=self._columnNames, copy=False)
+        return self._lightCurve
+
 
     def inverse_pair(self, photID, maxObsHistID=10000000):
         """
@@ -293,7 +929,8 @@ class Photometry(BasePhotometry):
     def statTable(PropTuple, callableTuple,
                   grouped=None,
                   dataframe=None,
-                  groupTuple=None):
+                  groupTuple=None,
+                  groupIndex=None):
         """
         Parameters
         ----------
@@ -302,7 +939,15 @@ class Photometry(BasePhotometry):
         grouped :
         dataframe :
         groupTuple :
-        """
+        groupIndex : `GroupIndex`, defaults to None
+            precomputed grouping of `dataframe` by (`snid`, `band`)
+        """
+        if groupTuple is None and groupIndex is not None:
+            groupTuple = groupIndex.names
+        if grouped is None and tuple(groupTuple) == ('snid', 'band'):
+            return BasePhotometry.fastStatTable(PropTuple, callableTuple,
+                                                dataframe,
+                                                groupIndex=groupIndex)
         if grouped is None:
             grouped = dataframe.groupby(list(groupTuple))
         callable_strings = list(s.__name__ for s in callableTuple)
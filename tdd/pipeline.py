@@ -0,0 +1,208 @@
+"""
+Lazy evaluation of chains of operations on photometry tables. A
+`LazyPhotTable` records the steps of a typical chain
+(`sanitize_nan` -> SNR filter -> `discretize_time` -> `add_weightedColumns`
+-> `coaddpreprocessed` -> `summarize`) without evaluating them, and executes
+the whole chain in a single pass over chunks of complete objects, so that no
+intermediate table of the size of the photometry is materialized.
+"""
+from __future__ import absolute_import, print_function, division
+import numpy as np
+import pandas as pd
+from .lightcurve import LightCurve
+
+__all__ = ['LazyPhotTable', 'concat_summaries']
+
+_lightCurveColumns = ['snid', 'band', 'mjd', 'flux', 'fluxerr', 'zp', 'zpsys']
+
+
+def concat_summaries(summaries):
+    """
+    concatenate summaries (as returned by `LightCurve.summarize` or
+    `PhotTables.summary`) of disjoint sets of objects. Summaries of sets of
+    objects that were not observed in some bands lack some of the columns;
+    the columns are ordered as in the summary with the most columns.
+    """
+    summaries = list(summaries)
+    columns = list(max((s.columns for s in summaries), key=len))
+    columns += list(col for s in summaries for col in s.columns
+                    if col not in columns)
+    summary = pd.concat(summaries, sort=False).reindex(columns=columns)
+    summary.sort_index(kind='mergesort', inplace=True)
+    return summary
+
+
+class LazyPhotTable(object):
+    """
+    Recorded chain of operations on the photometry table `lcs`, executed by
+    `collect`. Each method recording a step returns a new instance, and
+    `explain` describes the fused plan.
+
+    Parameters
+    ----------
+    lcs : `pd.DataFrame` or `PhotTables`
+        photometry with standard column names, including `snid`
+    objectsPerChunk : int, defaults to 10000
+        number of objects processed in each chunk. Plans without `coadd` or
+        `summarize` are processed in chunks of as many rows.
+    """
+    def __init__(self, lcs, objectsPerChunk=10000, steps=()):
+        self.lcs = getattr(lcs, 'lcs', lcs)
+        self.objectsPerChunk = objectsPerChunk
+        self.steps = tuple(steps)
+
+    def _add(self, name, **kwargs):
+        names = list(step[0] for step in self.steps)
+        if 'summarize' in names:
+            raise ValueError('summarize must be the last step')
+        if name != 'summarize' and 'coadd' in names:
+            raise ValueError('only summarize may follow coadd', name)
+        return self.__class__(self.lcs, objectsPerChunk=self.objectsPerChunk,
+                              steps=self.steps + ((name, kwargs),))
+
+    def sanitize_nan(self):
+        """
+        record `LightCurve.sanitize_nan`, filling nans in `fluxerr` with the
+        mean of `fluxerr` over the whole table
+        """
+        return self._add('sanitize_nan')
+
+    def filter_snr(self, SNRmin):
+        """
+        record the selection of observations with `flux / fluxerr` > `SNRmin`
+        """
+        return self._add('filter_snr', SNRmin=SNRmin)
+
+    def discretize_time(self, timeOffset=0., timeStep=1.0):
+        """
+        record `LightCurve.discretize_time`
+        """
+        return self._add('discretize_time', timeOffset=timeOffset,
+                         timeStep=timeStep)
+
+    def add_weightedColumns(self, avg_cols=('mjd', 'flux', 'fluxerr', 'zp'),
+                            additional_cols=None):
+        """
+        record `LightCurve.add_weightedColumns`
+        """
+        return self._add('add_weightedColumns', avg_cols=avg_cols,
+                         additional_cols=additional_cols)
+
+    def coadd(self, additionalColsKept=None, additionalAvgCols=None):
+        """
+        record `LightCurve.coaddpreprocessed` grouping by (`snid`, `band`,
+        `night`), requiring `discretize_time` and `add_weightedColumns`
+        """
+        names = list(step[0] for step in self.steps)
+        if 'discretize_time' not in names or \
+                'add_weightedColumns' not in names:
+            raise ValueError('coadd requires discretize_time and '
+                             'add_weightedColumns')
+        return self._add('coadd', additionalColsKept=additionalColsKept,
+                         additionalAvgCols=additionalAvgCols)
+
+    def summarize(self, **kwargs):
+        """
+        record `LightCurve.summarize` with keyword arguments `kwargs`
+        """
+        return self._add('summarize', **kwargs)
+
+    def requiredColumns(self):
+        """
+        columns of the photometry read by the plan, or None if all of the
+        columns are needed, since the result has a row for each observation
+        """
+        names = list(step[0] for step in self.steps)
+        if 'coadd' not in names and 'summarize' not in names:
+            return None
+        columns = list(_lightCurveColumns)
+        for (name, kwargs) in self.steps:
+            for key in ('avg_cols', 'additionalColsKept', 'additionalAvgCols',
+                        'additional_cols'):
+                if kwargs.get(key) is not None:
+                    columns += list(kwargs[key])
+            if name == 'summarize':
+                columns += list(kwargs.get('vals', ('SNR', 'mjd', 'zp')))
+                columns += list(kwargs.get('grouping', ('snid', 'band')))
+        return list(col for col in pd.unique(np.array(columns, dtype=object))
+                    if col in self.lcs.columns)
+
+    def explain(self):
+        """
+        string describing the fused plan
+        """
+        columns = self.requiredColumns()
+        lines = ['Scan photometry ({0} rows), columns: {1}'.format(
+            len(self.lcs), 'all' if columns is None else ', '.join(columns))]
+        if any(step[0] == 'sanitize_nan' for step in self.steps):
+            lines.append('Pre-pass: mean of fluxerr over the table')
+        lines.append('Fused per chunk of {0} {1}:'.format(
+            self.objectsPerChunk, 'rows' if columns is None else 'objects'))
+        for (name, kwargs) in self.steps:
+            args = ', '.join('{0}={1!r}'.format(key, kwargs[key])
+                             for key in sorted(kwargs))
+            lines.append('    {0}({1})'.format(name, args))
+        lines.append('Concatenate chunk results')
+        return '\n'.join(lines)
+
+    def _runChunk(self, chunk, fillValues):
+        for (name, kwargs) in self.steps:
+            if name == 'sanitize_nan':
+                chunk.fillna(fillValues, inplace=True)
+            elif name == 'filter_snr':
+                snr = chunk['flux'].values / chunk['fluxerr'].values
+                chunk = chunk[snr > kwargs['SNRmin']]
+            elif name == 'discretize_time':
+                chunk = LightCurve.discretize_time(chunk, **kwargs)
+            elif name == 'add_weightedColumns':
+                chunk = LightCurve.add_weightedColumns(chunk, copy=False,
+                                                       **kwargs)
+            elif name == 'coadd':
+                chunk = LightCurve.coaddpreprocessed(
+                    chunk, include_snid=True,
+                    additionalAvgCols=kwargs['additionalAvgCols'],
+                    additionalColsKept=kwargs['additionalColsKept'],
+                    additionalAggFuncs='first', keepAll=False,
+                    keepCounts=True)
+            elif name == 'summarize':
+                chunk = LightCurve.summarize(chunk, **kwargs)
+        return chunk
+
+    def collect(self):
+        """
+        execute the plan and return the result
+        """
+        lcs = self.lcs
+        fillValues = None
+        if any(step[0] == 'sanitize_nan' for step in self.steps):
+            fillValues = dict(flux=0., fluxerr=lcs.fluxerr.mean(skipna=True))
+
+        columns = self.requiredColumns()
+        aggregated = columns is not None
+        if not aggregated:
+            columns = list(lcs.columns)
+        colIndex = list(lcs.columns.get_loc(col) for col in columns)
+
+        if aggregated:
+            # rows of complete objects in order of snid
+            codes, _ = pd.factorize(lcs['snid'], sort=True)
+            order = np.argsort(codes, kind='mergesort')
+            objStarts = np.flatnonzero(np.diff(codes[order], prepend=-1) != 0)
+            bounds = np.append(objStarts[::self.objectsPerChunk], len(order))
+        else:
+            # row-wise steps only, so that chunks of rows keep their order
+            order = np.arange(len(lcs))
+            bounds = np.append(np.arange(0, len(lcs), self.objectsPerChunk),
+                               len(lcs))
+
+        results = []
+        for i in range(len(bounds) - 1):
+            rows = order[bounds[i]: bounds[i + 1]]
+            chunk = lcs.iloc[rows, colIndex].copy()
+            results.append(self._runChunk(chunk, fillValues))
+
+        if len(results) == 0:
+            return self._runChunk(lcs.iloc[:0, colIndex].copy(), fillValues)
+        if self.steps and self.steps[-1][0] == 'summarize':
+            return concat_summaries(results)
+        return pd.concat(results, ignore_index=aggregated)
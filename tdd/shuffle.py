@@ -0,0 +1,108 @@
+"""
+External shuffle of photometry produced in pointing (or tile) order, as in
+simulations driven by `HealpixTiles` or `HealPixelizedOpSim`, into object
+order, where the photometry of each `snid` is contiguous and sorted in time
+as required by `LightCurve` and `PhotTables`. Input batches are streamed into
+partitions on disk hashed on `snid`, and each partition is then sorted in
+memory, so that the memory used is bounded by the size of a batch or a
+partition rather than the size of the photometry.
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import json
+import multiprocessing
+import numpy as np
+import pandas as pd
+from .partitioned import PartitionWriter, PartitionedPhotTables
+
+__all__ = ['sort_partition', 'shuffle_to_object_major']
+
+
+def sort_partition(fnames, outputFile, sortKeys=('snid', 'mjd')):
+    """
+    read the chunks of a partition in `fnames`, sort the rows by `sortKeys`
+    and write them to `outputFile`, removing the chunks.
+
+    Returns
+    -------
+    number of rows in the partition
+    """
+    if len(fnames) == 0:
+        return 0
+    df = pd.concat(list(pd.read_pickle(fname) for fname in fnames),
+                   ignore_index=True)
+    order = np.lexsort(tuple(df[key].values for key in sortKeys[::-1]))
+    df = df.iloc[order].reset_index(drop=True)
+    tmpFile = outputFile + '.tmp'
+    df.to_pickle(tmpFile)
+    for fname in fnames:
+        os.remove(fname)
+    os.rename(tmpFile, outputFile)
+    return len(df)
+
+
+def _sortPartition(args):
+    return sort_partition(*args)
+
+
+def shuffle_to_object_major(batches, directory, numPartitions=64,
+                            sortKeys=('snid', 'mjd'), nproc=1,
+                            overwrite=False):
+    """
+    Reorder photometry supplied in batches of arbitrary order (eg. pointing
+    order) into an object ordered store in `directory`: each partition holds
+    complete objects hashed on `snid`, with rows sorted by `sortKeys`.
+
+    Parameters
+    ----------
+    batches : iterable of `pd.DataFrame`
+        photometry with (aliases of) the columns of `PhotTables`. Batches are
+        consumed one at a time.
+    directory : string
+        directory of the output store
+    numPartitions : int, defaults to 64
+        number of partitions. This should be large enough for the largest
+        partition (about the size of the photometry / `numPartitions`) to be
+        sorted in the memory of a process.
+    sortKeys : tuple of strings, defaults to ('snid', 'mjd')
+        keys by which the rows of each partition are sorted
+    nproc : int, defaults to 1
+        number of processes sorting partitions
+    overwrite : Bool, defaults to False
+        if True, a store written earlier to `directory` is replaced.
+        Otherwise, a `ValueError` is raised if there is one.
+
+    Returns
+    -------
+    instance of `PartitionedPhotTables` on the sorted store
+    """
+    writer = PartitionWriter(directory, numPartitions=numPartitions,
+                             overwrite=overwrite)
+    for batch in batches:
+        writer.write(batch)
+    writer.close()
+
+    store = PartitionedPhotTables(directory, nproc=nproc)
+    tasks = list((store.partitionFiles(i),
+                  os.path.join(writer.partitionDirectory(i),
+                               'chunk_{:06d}.pkl'.format(0)),
+                  tuple(sortKeys))
+                 for i in range(numPartitions))
+    if nproc > 1:
+        pool = multiprocessing.Pool(nproc)
+        try:
+            numRows = pool.map(_sortPartition, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        numRows = list(map(_sortPartition, tasks))
+
+    if sum(numRows) != writer.numRows:
+        raise ValueError('number of rows in sorted partitions does not match'
+                         ' the input', sum(numRows), writer.numRows)
+
+    store.metadata['sortedBy'] = list(sortKeys)
+    with open(os.path.join(directory, 'metadata.json'), 'w') as fh:
+        json.dump(store.metadata, fh)
+    return store
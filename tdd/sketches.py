@@ -0,0 +1,264 @@
+"""
+Streaming approximate quantiles of photometric quantities (eg. SNR, flux,
+fluxerr) over photometry too large to be held in memory. `KLLSketch` is a
+mergeable quantile sketch of fixed size (Karnin, Lang & Liberty 2016), and
+`QuantileSketches` holds sketches for several columns and groups (eg. band,
+class), which are updated from chunks of photometry and merged across
+processes.
+"""
+from __future__ import absolute_import, print_function, division
+import numpy as np
+import pandas as pd
+from .grouping import GroupIndex
+
+__all__ = ['KLLSketch', 'QuantileSketches']
+
+
+class KLLSketch(object):
+    """
+    Mergeable sketch of a stream of floats answering quantile queries with
+    a rank error of about 2 / `k` (with high probability) of the number of
+    values, while retaining at most about 3 `k` values.
+
+    Parameters
+    ----------
+    k : int, defaults to 200
+        capacity of the largest compactor, which sets the accuracy
+    seed : int, defaults to None
+        seed of the random choices made in compactions
+    """
+    _decay = 2. / 3.
+
+    def __init__(self, k=200, seed=None):
+        if k < 8:
+            raise ValueError('k must be at least 8', k)
+        self.k = k
+        self.rng = np.random.RandomState(seed)
+        self.compactors = [np.zeros(0)]
+        self.count = 0
+        self.min = np.nan
+        self.max = np.nan
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def numRetained(self):
+        return sum(len(compactor) for compactor in self.compactors)
+
+    @property
+    def nbytes(self):
+        return sum(compactor.nbytes for compactor in self.compactors)
+
+    def capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return max(2, int(np.ceil(self.k * self._decay ** depth)))
+
+    def update(self, values):
+        """
+        add the (non nan) `values` to the sketch
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return self
+        self.count += len(values)
+        self.min = np.fmin(self.min, values.min())
+        self.max = np.fmax(self.max, values.max())
+        self.compactors[0] = np.concatenate((self.compactors[0], values))
+        self._compress()
+        return self
+
+    def _compress(self):
+        level = 0
+        while level < len(self.compactors):
+            compactor = self.compactors[level]
+            if len(compactor) <= self.capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.compactors):
+                self.compactors.append(np.zeros(0))
+            # an odd item stays, every other one of the others is promoted
+            compactor = np.sort(compactor)
+            numKept = len(compactor) % 2
+            promoted = compactor[numKept + self.rng.randint(2)::2]
+            self.compactors[level] = compactor[:numKept]
+            self.compactors[level + 1] = np.concatenate(
+                (self.compactors[level + 1], promoted))
+            # capacities of the lower levels shrink as levels are added
+            level = 0
+
+    def merge(self, other):
+        """
+        merge the sketch `other` into this sketch, which then summarizes the
+        union of both streams
+        """
+        if other.count == 0:
+            return self
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append(np.zeros(0))
+        for (level, compactor) in enumerate(other.compactors):
+            self.compactors[level] = np.concatenate((self.compactors[level],
+                                                     compactor))
+        self.count += other.count
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self._compress()
+        return self
+
+    def _sortedValues(self):
+        values = np.concatenate(self.compactors)
+        weights = np.concatenate(list(np.full(len(compactor), 2.**level)
+                                      for (level, compactor)
+                                      in enumerate(self.compactors)))
+        order = np.argsort(values, kind='mergesort')
+        return values[order], np.cumsum(weights[order])
+
+    def quantile(self, q):
+        """
+        approximate `q` quantiles (scalar or array in [0, 1]) of the values
+        """
+        q = np.asarray(q, dtype=np.float64)
+        if self.count == 0:
+            return np.full(q.shape, np.nan)
+        values, cumweights = self._sortedValues()
+        idx = np.searchsorted(cumweights, q * cumweights[-1], side='left')
+        result = values[np.clip(idx, 0, len(values) - 1)]
+        result = np.where(q <= 0., self.min, result)
+        return np.where(q >= 1., self.max, result)
+
+    def rank(self, x):
+        """
+        approximate fraction of the values less than or equal to `x`
+        """
+        x = np.asarray(x, dtype=np.float64)
+        if self.count == 0:
+            return np.full(x.shape, np.nan)
+        values, cumweights = self._sortedValues()
+        idx = np.searchsorted(values, x, side='right')
+        ranks = np.append(0., cumweights)[idx]
+        return ranks / cumweights[-1]
+
+
+class QuantileSketches(object):
+    """
+    `KLLSketch` of each of the columns `columns` of photometry for each
+    group of rows with the same values of the keys `by`.
+
+    Parameters
+    ----------
+    columns : tuple of strings, defaults to ('SNR', 'flux', 'fluxerr')
+        columns sketched. `SNR` is computed from `flux` and `fluxerr` if it
+        is not a column.
+    by : tuple of strings, defaults to ('band',)
+        grouping keys, which are columns of the photometry or of the
+        `metadata` supplied to `update`
+    k : int, defaults to 200
+        accuracy parameter of the sketches
+    seed : int, defaults to None
+        seed of the random choices made by the sketches
+
+    Example
+    -------
+    >>> sketches = QuantileSketches(by=('band', 'target'))
+    >>> for chunk in pd.read_csv(photfile, chunksize=1000000):
+    ...     sketches.update(chunk, metadata=metadata)
+    >>> sketches.quantiles((0.05, 0.5, 0.95))
+    """
+    def __init__(self, columns=('SNR', 'flux', 'fluxerr'), by=('band',),
+                 k=200, seed=None):
+        self.columns = tuple(columns)
+        self.by = tuple(by)
+        self.k = k
+        self.rng = np.random.RandomState(seed)
+        self.sketches = dict()
+
+    def _newSketch(self):
+        return KLLSketch(self.k, seed=self.rng.randint(2**31))
+
+    def update(self, lcs, metadata=None):
+        """
+        add the photometry `lcs` to the sketches
+
+        Parameters
+        ----------
+        lcs : `pd.DataFrame` or `PhotTables`
+            chunk of photometry with the columns in `columns` and `by`
+        metadata : `pd.DataFrame`, defaults to None
+            table indexed by `snid`, in which the keys of `by` which are not
+            columns of `lcs` are looked up (eg. the class of each object)
+        """
+        lcs = getattr(lcs, 'lcs', lcs)
+        keys = []
+        for key in self.by:
+            if key in lcs.columns:
+                keys.append(lcs[key].values)
+            elif metadata is not None and key in metadata.columns:
+                keys.append(metadata[key].reindex(lcs['snid'].values).values)
+            else:
+                raise ValueError('grouping key not found', key)
+        values = dict()
+        for col in self.columns:
+            if col == 'SNR' and col not in lcs.columns:
+                values[col] = lcs['flux'].values / lcs['fluxerr'].values
+            else:
+                values[col] = lcs[col].values
+
+        if len(keys) == 0:
+            groups, rowsOfGroups = [()], [np.arange(len(lcs))]
+        else:
+            groupIndex = GroupIndex(keys, names=self.by)
+            groups = list(zip(*(groupIndex.keyValues(i)
+                                for i in range(len(self.by)))))
+            rowsOfGroups = np.split(groupIndex.order, groupIndex.starts[1:])
+        for (group, rows) in zip(groups, rowsOfGroups):
+            for col in self.columns:
+                sketch = self.sketches.get((group, col))
+                if sketch is None:
+                    sketch = self.sketches[(group, col)] = self._newSketch()
+                sketch.update(values[col][rows])
+        return self
+
+    def merge(self, other):
+        """
+        merge the sketches of `other`, built with the same `columns` and
+        `by`, into these sketches
+        """
+        if self.columns != other.columns or self.by != other.by:
+            raise ValueError('cannot merge sketches of different columns or '
+                             'groupings')
+        for (key, sketch) in other.sketches.items():
+            if key not in self.sketches:
+                self.sketches[key] = self._newSketch()
+            self.sketches[key].merge(sketch)
+        return self
+
+    @classmethod
+    def fromChunks(cls, chunks, metadata=None, **kwargs):
+        """
+        sketches of a sequence of chunks of photometry, eg. the chunks of a
+        `PartitionedPhotTables` or of `pd.read_csv(..., chunksize=...)`
+        """
+        sketches = cls(**kwargs)
+        for chunk in chunks:
+            sketches.update(chunk, metadata=metadata)
+        return sketches
+
+    @property
+    def nbytes(self):
+        return sum(sketch.nbytes for sketch in self.sketches.values())
+
+    def quantiles(self, q=(0.05, 0.25, 0.5, 0.75, 0.95)):
+        """
+        `pd.DataFrame` of the approximate quantiles `q` of each column,
+        indexed by the grouping keys and the quantile
+        """
+        q = np.atleast_1d(q)
+        groups = sorted(set(group for (group, col) in self.sketches))
+        data = dict((col, np.concatenate(list(
+            self.sketches[(group, col)].quantile(q)
+            for group in groups))) for col in self.columns)
+        tuples = list(group + (qq,) for group in groups for qq in q)
+        index = pd.MultiIndex.from_tuples(tuples,
+                                          names=list(self.by) + ['quantile'])
+        return pd.DataFrame(data, index=index, columns=list(self.columns))
@@ -0,0 +1,214 @@
+"""
+Export of photometry tables to fixed shape arrays of shape
+(number of objects, number of bands, number of times) for use in machine
+learning models. The light curves of each object are binned or interpolated
+onto a regular grid of times relative to a reference epoch of the object.
+"""
+from __future__ import absolute_import, print_function, division
+import numpy as np
+import pandas as pd
+
+__all__ = ['light_curve_tensor']
+
+
+def _referenceEpochs(mjd, flux, fluxerr, objStarts, reference, detectionSNR):
+    """
+    reference epoch for each object in a batch of rows sorted by object
+    """
+    firstmjd = np.minimum.reduceat(mjd, objStarts)
+    if reference == 'first':
+        return firstmjd
+
+    counts = np.diff(np.append(objStarts, len(mjd)))
+    if reference == 'first_detection':
+        detected = flux >= detectionSNR * fluxerr
+        epochs = np.minimum.reduceat(np.where(detected, mjd, np.inf),
+                                     objStarts)
+        return np.where(np.isfinite(epochs), epochs, firstmjd)
+    elif reference == 'peak':
+        peak = np.repeat(np.maximum.reduceat(flux, objStarts), counts)
+        positions = np.where(flux == peak, np.arange(len(flux)), len(flux))
+        return mjd[np.minimum.reduceat(positions, objStarts)]
+    else:
+        raise ValueError('reference must be one of first, first_detection'
+                         ' or peak', reference)
+
+
+def _binBatch(seg, trel, flux, fluxerr, numSegs, tmin, timeStep, numTimes):
+    """
+    inverse variance weighted averages of flux in bins of times for each
+    (object, band) segment of a batch
+    """
+    timeIndex = np.floor((trel - tmin) / timeStep).astype(np.int64)
+    keep = (timeIndex >= 0) & (timeIndex < numTimes)
+    flat = seg[keep] * numTimes + timeIndex[keep]
+    weights = 1.0 / fluxerr[keep]**2
+
+    size = numSegs * numTimes
+    sumw = np.bincount(flat, weights=weights, minlength=size)
+    sumwf = np.bincount(flat, weights=weights * flux[keep], minlength=size)
+    mask = sumw > 0.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        vals = np.where(mask, sumwf / sumw, 0.)
+        errs = np.where(mask, 1.0 / np.sqrt(sumw), 0.)
+    return vals, errs, mask
+
+
+def _interpBatch(seg, trel, flux, fluxerr, numSegs, times):
+    """
+    linear interpolation of the flux of each (object, band) segment of a
+    batch at `times`. Times outside the range of observations are masked.
+    """
+    numTimes = len(times)
+    lo = min(trel.min(), times[0])
+    span = max(trel.max(), times[-1]) - lo + 1.
+    keys = seg * span + (trel - lo)
+
+    qseg = np.repeat(np.arange(numSegs), numTimes)
+    qtimes = np.tile(times, numSegs)
+    qkeys = qseg * span + (qtimes - lo)
+
+    right = np.searchsorted(keys, qkeys, side='right')
+    left = np.clip(right - 1, 0, len(keys) - 1)
+    right = np.clip(right, 0, len(keys) - 1)
+
+    inside = (seg[left] == qseg) & (seg[right] == qseg) & \
+        (trel[left] <= qtimes) & (trel[right] >= qtimes)
+    exact = (seg[left] == qseg) & (trel[left] == qtimes)
+    mask = inside | exact
+
+    dt = trel[right] - trel[left]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frac = np.where(inside & (dt > 0.), (qtimes - trel[left]) / dt, 0.)
+    vals = flux[left] + frac * (flux[right] - flux[left])
+    errs = fluxerr[left] + frac * (fluxerr[right] - fluxerr[left])
+    vals[~mask] = 0.
+    errs[~mask] = 0.
+    return vals, errs, mask
+
+
+def light_curve_tensor(phot, bands, tmin=-30., tmax=100., timeStep=1.0,
+                       reference='first_detection', method='bin',
+                       detectionSNR=5., objectsPerBatch=10000,
+                       outputPrefix=None):
+    """
+    Bin or interpolate the light curves in a photometry table onto a regular
+    grid of times relative to a reference epoch for each object, and return
+    arrays of shape (number of objects, number of bands, number of times).
+
+    Parameters
+    ----------
+    phot : `pd.DataFrame` or `PhotTables`
+        photometry with columns `snid`, `band`, `mjd`, `flux`, `fluxerr`
+    bands : sequence of strings
+        bands in the order of the second axis of the output arrays.
+        Photometry in other bands is ignored.
+    tmin : float, units of days, defaults to -30.
+        start of the time grid relative to the reference epoch
+    tmax : float, units of days, defaults to 100.
+        end of the time grid relative to the reference epoch
+    timeStep : float, units of days, defaults to 1.0
+        spacing of the time grid
+    reference : {'first_detection', 'first', 'peak'}
+        reference epoch of each object; the first observation with
+        flux / fluxerr >= `detectionSNR` (or the first observation if there
+        is no such observation), the first observation, or the observation
+        with the highest flux in any band.
+    method : {'bin', 'interp'}, defaults to 'bin'
+        if 'bin', inverse variance weighted averages over bins
+        [tmin + i * timeStep, tmin + (i + 1) * timeStep). If 'interp', linear
+        interpolation at the centers of the bins without extrapolation.
+    detectionSNR : float, defaults to 5.
+        threshold on SNR for detections
+    objectsPerBatch : int, defaults to 10000
+        number of objects processed at a time
+    outputPrefix : string, defaults to None
+        if not None, the arrays are written as memory mapped `.npy` files with
+        names `outputPrefix` + one of `_snid.npy`, `_flux.npy`,
+        `_fluxerr.npy`, `_mask.npy`
+
+    Returns
+    -------
+    tuple of `np.ndarray` (snid, flux, fluxerr, mask) where `flux` and
+    `fluxerr` are contiguous float32 arrays, and `mask` is a boolean array
+    which is True for entries with data. Entries without data are 0.
+    """
+    if method not in ('bin', 'interp'):
+        raise ValueError('method must be bin or interp', method)
+
+    lcs = getattr(phot, 'lcs', phot)
+    bands = list(bands)
+    numBands = len(bands)
+    numTimes = int(np.ceil((tmax - tmin) / timeStep))
+    times = tmin + timeStep * (np.arange(numTimes) + 0.5)
+
+    # Sort once by (snid, band, mjd) with bands in the requested order
+    bandIndex = pd.Index(bands).get_indexer(lcs['band'].values)
+    sel = np.flatnonzero(bandIndex >= 0)
+    snid = lcs['snid'].values[sel]
+    mjd = lcs['mjd'].values[sel]
+    bandIndex = bandIndex[sel]
+    order = np.lexsort((mjd, bandIndex, snid))
+    snid = snid[order]
+    mjd = np.asarray(mjd[order], dtype=np.float64)
+    bandIndex = bandIndex[order]
+    sel = sel[order]
+    flux = np.asarray(lcs['flux'].values[sel], dtype=np.float64)
+    fluxerr = np.asarray(lcs['fluxerr'].values[sel], dtype=np.float64)
+    del sel, order
+
+    objStarts = np.flatnonzero(np.append(True, snid[1:] != snid[:-1])) \
+        if len(snid) > 0 else np.zeros(0, dtype=np.int64)
+    numObjects = len(objStarts)
+    objStarts = np.append(objStarts, len(snid))
+
+    shape = (numObjects, numBands, numTimes)
+    if outputPrefix is None:
+        snids = snid[objStarts[:-1]]
+        outflux = np.zeros(shape, dtype=np.float32)
+        outerr = np.zeros(shape, dtype=np.float32)
+        outmask = np.zeros(shape, dtype=bool)
+    else:
+        openmm = np.lib.format.open_memmap
+        snids = openmm(outputPrefix + '_snid.npy', mode='w+',
+                       dtype=snid.dtype, shape=(numObjects,))
+        snids[:] = snid[objStarts[:-1]]
+        outflux = openmm(outputPrefix + '_flux.npy', mode='w+',
+                         dtype=np.float32, shape=shape)
+        outerr = openmm(outputPrefix + '_fluxerr.npy', mode='w+',
+                        dtype=np.float32, shape=shape)
+        outmask = openmm(outputPrefix + '_mask.npy', mode='w+',
+                         dtype=bool, shape=shape)
+
+    for ostart in range(0, numObjects, objectsPerBatch):
+        ostop = min(ostart + objectsPerBatch, numObjects)
+        rstart, rstop = objStarts[ostart], objStarts[ostop]
+        bStarts = objStarts[ostart:ostop] - rstart
+        bmjd = mjd[rstart:rstop]
+        bflux = flux[rstart:rstop]
+        berr = fluxerr[rstart:rstop]
+
+        epochs = _referenceEpochs(bmjd, bflux, berr, bStarts, reference,
+                                  detectionSNR)
+        counts = np.diff(np.append(bStarts, rstop - rstart))
+        objIndex = np.repeat(np.arange(ostop - ostart), counts)
+        trel = bmjd - epochs[objIndex]
+        seg = objIndex * numBands + bandIndex[rstart:rstop]
+        numSegs = (ostop - ostart) * numBands
+
+        if method == 'bin':
+            vals, errs, mask = _binBatch(seg, trel, bflux, berr, numSegs,
+                                         tmin, timeStep, numTimes)
+        else:
+            vals, errs, mask = _interpBatch(seg, trel, bflux, berr, numSegs,
+                                            times)
+
+        bshape = (ostop - ostart, numBands, numTimes)
+        outflux[ostart:ostop] = vals.reshape(bshape)
+        outerr[ostart:ostop] = errs.reshape(bshape)
+        outmask[ostart:ostop] = mask.reshape(bshape)
+
+    if outputPrefix is not None:
+        for arr in (snids, outflux, outerr, outmask):
+            arr.flush()
+    return snids, outflux, outerr, outmask
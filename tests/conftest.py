@@ -0,0 +1,34 @@
+import os
+import pytest
+import tdd
+from tdd import read_plasticc_data
+
+
+@pytest.fixture(scope='session')
+def _plasticc_data():
+    example_meta = os.path.join(tdd.example_data,
+                                'plasticc_train_meta.csv')
+    example_phot = os.path.join(tdd.example_data,
+                                'plasticc_train_phot.csv')
+    metadata, photometry = read_plasticc_data(example_meta, example_phot)
+    photometry.rename(columns=dict(tid='snid'), inplace=True)
+    photometry['tileID'] = photometry.snid % 7
+    photometry['fieldID'] = photometry.snid % 3
+    return metadata, photometry
+
+
+@pytest.fixture
+def plasticc_metadata(_plasticc_data):
+    """
+    metadata of the PLAsTiCC example data, indexed by `snid`
+    """
+    return _plasticc_data[0].copy()
+
+
+@pytest.fixture
+def plasticc_phot(_plasticc_data):
+    """
+    photometry of the PLAsTiCC example data with the standard column names
+    and the columns `tileID` and `fieldID`, which tests may modify
+    """
+    return _plasticc_data[1].copy()
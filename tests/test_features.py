@@ -0,0 +1,72 @@
+import numpy as np
+from tdd import extract_features, light_curve_tensor, gp_interpolate
+
+lsstbands = ('lsstu', 'lsstg', 'lsstr', 'lssti', 'lsstz', 'lssty')
+
+
+def test_extract_features(plasticc_phot):
+    phot = plasticc_phot
+    features = extract_features(phot, bands=lsstbands, objectsPerChunk=7)
+
+    assert len(features) == phot.snid.unique().size
+    assert 'color_lsstg_lsstr' in features.columns
+
+    grouped = phot.groupby(['snid', 'band'])
+    peak = grouped.flux.max().unstack()[list(lsstbands)]
+    np.testing.assert_allclose(features[list('peakflux_' + b
+                                             for b in lsstbands)].values,
+                               peak.values)
+    nobs = grouped.flux.count().unstack()[list(lsstbands)]
+    np.testing.assert_allclose(features[list('nobs_' + b
+                                             for b in lsstbands)].values,
+                               nobs.values)
+
+
+def test_extract_features_empty(plasticc_phot):
+    phot = plasticc_phot.iloc[:0]
+    features = extract_features(phot, bands=lsstbands)
+    assert len(features) == 0
+    assert 'risetime_lsstg' in features.columns
+
+
+def test_extract_features_parallel(plasticc_phot):
+    phot = plasticc_phot
+    serial = extract_features(phot, features=('risetime', 'skew'),
+                              colors=False, objectsPerChunk=5)
+    parallel = extract_features(phot, features=('risetime', 'skew'),
+                                colors=False, objectsPerChunk=5, nproc=2)
+    assert serial.shape == (20, 12)
+    np.testing.assert_allclose(serial.values, parallel.values)
+
+
+def test_light_curve_tensor(plasticc_phot):
+    phot = plasticc_phot
+    snids, flux, fluxerr, mask = light_curve_tensor(phot, lsstbands,
+                                                    tmin=-50., tmax=150.,
+                                                    timeStep=2.,
+                                                    objectsPerBatch=6)
+    assert flux.shape == (20, 6, 100)
+    assert flux.dtype == np.float32
+    assert flux.flags['C_CONTIGUOUS']
+    np.testing.assert_array_equal(np.sort(snids), np.unique(phot.snid))
+    assert not flux[~mask].any()
+
+    _, iflux, _, imask = light_curve_tensor(phot, lsstbands, tmin=-50.,
+                                            tmax=150., timeStep=2.,
+                                            method='interp')
+    assert iflux.shape == flux.shape
+    assert not iflux[~imask].any()
+
+
+def test_gp_interpolate(plasticc_phot):
+    phot = plasticc_phot
+    times = np.linspace(-20., 60., 9)
+    snids, mean, std = gp_interpolate(phot, lsstbands, times,
+                                      objectsPerChunk=6)
+    assert mean.shape == (20, 6, 9)
+    assert np.all(np.isfinite(mean))
+    assert np.all(std >= 0.)
+
+    _, pmean, _ = gp_interpolate(phot, lsstbands, times, objectsPerChunk=6,
+                                 nproc=2)
+    np.testing.assert_allclose(mean, pmean, rtol=1e-5)
@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+import healpy as hp
+import pytest
+
+from tdd import healpix
+
+
+def _opsim(numPointings=2000, numFields=None, seed=0):
+    rng = np.random.RandomState(seed)
+    size = numPointings if numFields is None else numFields
+    ra = rng.uniform(0., 2. * np.pi, size)
+    dec = np.arcsin(rng.uniform(-1., 0.2, size))
+    if numFields is not None:
+        fields = rng.randint(0, numFields, numPointings)
+        ra, dec = ra[fields], dec[fields]
+    obsHistID = pd.Index(3 * np.arange(1, numPointings + 1), name='obsHistID')
+    return pd.DataFrame(dict(ditheredRA=ra, ditheredDec=dec), index=obsHistID)
+
+
+def _associations(opsimdf, nside, fieldRadius=1.75):
+    vecs = hp.ang2vec(np.pi / 2. - opsimdf.ditheredDec.values,
+                      opsimdf.ditheredRA.values)
+    hids = list(hp.query_disc(nside, vec, np.radians(fieldRadius),
+                              inclusive=True, fact=4, nest=True)
+                for vec in vecs)
+    rows = np.repeat(np.arange(len(opsimdf)), list(map(len, hids)))
+    return rows, np.concatenate(hids)
+
+
+def test_precalcs():
+    opsimdf = _opsim()
+    rows, cols = _associations(opsimdf, nside=32)
+    for nproc in (1, 2):
+        hpOpSim = healpix.HealPixelizedOpSim(opsimdf, NSIDE=32, nproc=nproc)
+        hpOpSim.doPreCalcs(chunkSize=300)
+        np.testing.assert_array_equal(hpOpSim.rowdata, rows)
+        np.testing.assert_array_equal(hpOpSim.coldata, cols)
+
+
+def test_precalcs_repeated_fields():
+    opsimdf = _opsim(numPointings=3000, numFields=40)
+    rows, cols = _associations(opsimdf, nside=32)
+    hpOpSim = healpix.HealPixelizedOpSim(opsimdf, NSIDE=32)
+    for dedup in (True, False):
+        hpOpSim.doPreCalcs(dedup=dedup)
+        np.testing.assert_array_equal(hpOpSim.rowdata, rows)
+        np.testing.assert_array_equal(hpOpSim.coldata, cols)
+
+
+def test_npy_roundtrip(tmpdir):
+    opsimdf = _opsim(numPointings=500)
+    hpOpSim = healpix.HealPixelizedOpSim(opsimdf, NSIDE=32)
+    hpOpSim.writeToNpy(str(tmpdir))
+    for mmap in (True, False):
+        loaded = healpix.HealPixelizedOpSim.fromNpy(str(tmpdir), mmap=mmap)
+        assert loaded.nside == 32
+        assert (loaded.sparseMat != hpOpSim.sparseMat).nnz == 0
+        assert (loaded.sparseMatCSC != hpOpSim.sparseMat).nnz == 0
+        np.testing.assert_array_equal(loaded.rowdata, hpOpSim.rowdata)
+        np.testing.assert_array_equal(loaded.coldata, hpOpSim.coldata)
+        np.testing.assert_array_equal(loaded.opsimdf.obsHistID,
+                                      opsimdf.index.values)
+
+
+def test_write_to_db(tmpdir):
+    import sqlite3
+    opsimdf = _opsim(numPointings=500)
+    hpOpSim = healpix.HealPixelizedOpSim(opsimdf, NSIDE=32)
+    dbName = str(tmpdir.join('simlib.db'))
+    hpOpSim.writeToDB(dbName, hostname='host', batchSize=1000)
+    conn = sqlite3.Connection(dbName)
+    simlib = pd.read_sql_query('SELECT * FROM simlib', conn)
+    metadata = pd.read_sql_query('SELECT * FROM metadata', conn)
+    indexes = pd.read_sql_query('SELECT name FROM sqlite_master WHERE '
+                                'type="index"', conn)
+    conn.close()
+    np.testing.assert_array_equal(simlib.ipix, hpOpSim.coldata)
+    np.testing.assert_array_equal(simlib.obsHistId,
+                                  opsimdf.index.values[hpOpSim.rowdata])
+    assert metadata.numRecords.iloc[0] == len(simlib)
+    assert metadata.NSIDE.iloc[0] == 32
+    assert set(indexes.name) == set(('ipix_ind', 'obshistid_ind'))
+
+
+def test_obsHistIdsForTiles():
+    opsimdf = _opsim(numPointings=500)
+    hpOpSim = healpix.HealPixelizedOpSim(opsimdf, NSIDE=32)
+    tileIDs = np.array([0, 5000, 8000, 5000, 12287])
+    obsHistIDs, offsets = hpOpSim.obsHistIdsForTiles(tileIDs)
+    assert len(offsets) == len(tileIDs) + 1
+    for (i, tileID) in enumerate(tileIDs):
+        expected = opsimdf.index.values[hpOpSim.rowdata[hpOpSim.coldata ==
+                                                        tileID]]
+        np.testing.assert_array_equal(hpOpSim.obsHistIdsForTile(tileID),
+                                      expected)
+        np.testing.assert_array_equal(obsHistIDs[offsets[i]:offsets[i + 1]],
+                                      expected)
+
+
+def test_pointing_vectors():
+    opsimdf = _opsim(numPointings=100)
+    vecs = hp.ang2vec(np.pi / 2. - opsimdf.ditheredDec.values,
+                      opsimdf.ditheredRA.values)
+    hpOpSim = healpix.HealPixelizedOpSim(opsimdf, NSIDE=32)
+    assert hpOpSim.vecs.shape == (100, 3)
+    assert hpOpSim.vecs.flags['C_CONTIGUOUS']
+    np.testing.assert_allclose(hpOpSim.vecs, vecs)
+    assert 'vec' not in hpOpSim.opsimdf.columns
+
+    withVecs = opsimdf.copy()
+    healpix.addVec(withVecs)
+    hpOpSim = healpix.HealPixelizedOpSim(withVecs, NSIDE=32)
+    np.testing.assert_allclose(hpOpSim.vecs, vecs)
+
+
+def test_append_remove_pointings(tmpdir):
+    import sqlite3
+    opsimdf = _opsim(numPointings=500)
+    full = healpix.HealPixelizedOpSim(opsimdf, NSIDE=32)
+
+    directory = str(tmpdir.join('npy'))
+    dbName = str(tmpdir.join('simlib.db'))
+    hpOpSim = healpix.HealPixelizedOpSim(opsimdf.iloc[:300], NSIDE=32)
+    hpOpSim.writeToNpy(directory)
+    hpOpSim.writeToDB(dbName, hostname='host')
+    loaded = healpix.HealPixelizedOpSim.fromNpy(directory)
+    for hp_ in (hpOpSim, loaded):
+        hp_.appendPointings(opsimdf.iloc[300:])
+        assert (hp_.sparseMat != full.sparseMat).nnz == 0
+        np.testing.assert_array_equal(hp_.rowdata, full.rowdata)
+        np.testing.assert_array_equal(hp_.obsHistIdsForTile(5000),
+                                      full.obsHistIdsForTile(5000))
+    loaded.writeToNpy(directory)
+    reloaded = healpix.HealPixelizedOpSim.fromNpy(directory)
+    assert (reloaded.sparseMat != full.sparseMat).nnz == 0
+
+    removed = opsimdf.index.values[::3]
+    subset = healpix.HealPixelizedOpSim(opsimdf.drop(removed), NSIDE=32)
+    hpOpSim.removePointings(removed)
+    loaded.removePointings(removed)
+    for hp_ in (hpOpSim, loaded):
+        assert (hp_.sparseMat != subset.sparseMat).nnz == 0
+        np.testing.assert_array_equal(hp_.rowdata, subset.rowdata)
+        np.testing.assert_array_equal(hp_.coldata, subset.coldata)
+        np.testing.assert_allclose(hp_.vecs, subset.vecs)
+
+    with pytest.raises(ValueError):
+        hpOpSim.appendPointings(opsimdf.iloc[1:2])
+
+    dbOpSim = healpix.HealPixelizedOpSim(opsimdf.iloc[:300], NSIDE=32)
+    dbOpSim.appendPointings(opsimdf.iloc[300:], dbName=dbName)
+    dbOpSim.removePointings(removed, dbName=dbName)
+    # the associations of a fresh instance are kept through the updates
+    assert dbOpSim._rowdata is not None
+    np.testing.assert_array_equal(dbOpSim.rowdata, subset.rowdata)
+    np.testing.assert_array_equal(dbOpSim.coldata, subset.coldata)
+    conn = sqlite3.Connection(dbName)
+    simlib = pd.read_sql_query('SELECT * FROM simlib', conn)
+    metadata = pd.read_sql_query('SELECT * FROM metadata', conn)
+    conn.close()
+    assert metadata.numRecords.iloc[0] == len(simlib) == subset.sparseMat.nnz
+    np.testing.assert_array_equal(
+        np.sort(simlib.ipix.values * 10**6 + simlib.obsHistId.values),
+        np.sort(subset.coldata * 10**6 +
+                subset.opsimdf.obsHistID.values[subset.rowdata]))
+
+
+def test_pyramid(tmpdir):
+    opsimdf = _opsim(numPointings=300)
+    pyramid = healpix.HealPixelizedOpSimPyramid.fromOpSimDF(opsimdf,
+                                                            (8, 32, 16))
+    assert pyramid.nsides == [8, 16, 32]
+    fine = pyramid[32]
+    for nside in (8, 16):
+        level = pyramid[nside]
+        k = 2 * (5 - int(np.log2(nside)))
+        pairs = set(zip(fine.rowdata, fine.coldata >> k))
+        assert len(level.rowdata) == len(pairs)
+        assert set(zip(level.rowdata, level.coldata)) == pairs
+        assert level.sparseMat.shape == (300, 12 * nside**2)
+        tiles = np.unique(fine.coldata[fine.rowdata == 7] >> k)
+        np.testing.assert_array_equal(level.coldata[level.rowdata == 7],
+                                      tiles)
+        assert opsimdf.index.values[7] in \
+            pyramid.obsHistIdsForTile(tiles[0], nside=nside)
+
+    pyramid.writeToNpy(str(tmpdir))
+    loaded = healpix.HealPixelizedOpSimPyramid.fromNpy(str(tmpdir))
+    assert loaded.nsides == pyramid.nsides
+    for nside in loaded.nsides:
+        assert loaded[nside].nside == nside
+        assert (loaded[nside].sparseMat != pyramid[nside].sparseMat).nnz == 0
+    with pytest.raises(ValueError):
+        pyramid[64]
+    with pytest.raises(ValueError):
+        fine.atNside(64)
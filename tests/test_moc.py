@@ -0,0 +1,62 @@
+import numpy as np
+import healpy as hp
+from tdd.moc import MOC
+
+
+def test_moc_set_operations():
+    nside = 64
+    rng = np.random.RandomState(1)
+    a = np.unique(rng.randint(0, hp.nside2npix(nside), 3000))
+    b = np.unique(rng.randint(0, hp.nside2npix(nside), 3000))
+    mocA, mocB = MOC.fromPixels(a, nside), MOC.fromPixels(b, nside)
+    for (moc, expected) in ((mocA | mocB, np.union1d(a, b)),
+                            (mocA & mocB, np.intersect1d(a, b)),
+                            (mocA - mocB, np.setdiff1d(a, b))):
+        np.testing.assert_array_equal(moc.toPixels(nside), expected)
+        np.testing.assert_array_equal(moc.toPixels(nside * 2),
+                                      np.repeat(expected * 4, 4) +
+                                      np.tile(np.arange(4), len(expected)))
+    assert len(mocA - mocA) == 0
+    assert MOC.fromUniq(mocA.toUniq()) == mocA
+
+    # the 4 children of pixels 5 and 6 at NSIDE=8 are coarsened
+    moc = MOC.fromPixels(np.arange(20, 28), nside=8)
+    np.testing.assert_array_equal(moc.toUniq(), [4 * 16 + 5, 4 * 16 + 6])
+    assert moc.containsPixels([5, 6, 7], nside=4).tolist() == \
+        [True, True, False]
+
+
+def test_moc_contains():
+    nside = 64
+    rng = np.random.RandomState(2)
+    ipix = np.unique(rng.randint(0, hp.nside2npix(nside), 3000))
+    moc = MOC.fromPixels(ipix, nside)
+    ra = rng.uniform(0., 360., 10000)
+    dec = np.degrees(np.arcsin(rng.uniform(-1., 1., 10000)))
+    pix = hp.ang2pix(nside, np.radians(90. - dec), np.radians(ra), nest=True)
+    np.testing.assert_array_equal(moc.contains(ra, dec), np.isin(pix, ipix))
+
+
+def test_moc_uniq_deep_orders():
+    for order in (26, 29):
+        nside = 2**order
+        ipix = np.array([0, 5, 12 * 4**order - 1])
+        moc = MOC.fromPixels(ipix, nside)
+        np.testing.assert_array_equal(moc.toUniq(), 4 * 4**order + ipix)
+        assert MOC.fromUniq(moc.toUniq()) == moc
+
+
+def test_moc_from_healpixelized_opsim():
+    import pandas as pd
+    from tdd.healpix import HealPixelizedOpSim
+    rng = np.random.RandomState(2)
+    opsimdf = pd.DataFrame(dict(ditheredRA=rng.uniform(0., 2. * np.pi, 50),
+                                ditheredDec=np.arcsin(rng.uniform(-1., 0.2,
+                                                                  50))),
+                           index=pd.Index(np.arange(1, 51), name='obsHistID'))
+    mocs = list(MOC.fromHealPixelizedOpSim(
+        HealPixelizedOpSim(opsimdf, NSIDE=16, nest=nest), obsHistIDs=ids)
+        for ids in (None, [3, 7]) for nest in (True, False))
+    assert mocs[0] == mocs[1]
+    assert mocs[2] == mocs[3]
+    assert (mocs[2] - mocs[0]).area() == 0.
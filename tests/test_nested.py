@@ -0,0 +1,30 @@
+import numpy as np
+import healpy as hp
+from tdd.nested import (children, parents, change_nside, pixels_to_ranges,
+                        merge_ranges, in_ranges)
+
+
+def test_nested_hierarchy():
+    nside = 4
+    ipix = np.arange(hp.nside2npix(nside))
+    desc = children(ipix, 3, nside=nside)
+    assert len(desc) == 64 * len(ipix)
+    theta, phi = hp.pix2ang(nside * 8, desc, nest=True)
+    np.testing.assert_array_equal(hp.ang2pix(nside, theta, phi, nest=True),
+                                  np.repeat(ipix, 64))
+    np.testing.assert_array_equal(parents(desc, 3), np.repeat(ipix, 64))
+    np.testing.assert_array_equal(change_nside(desc, 32, 8), desc // 16)
+    np.testing.assert_array_equal(change_nside(ipix, 4, 16), ipix * 16)
+
+
+def test_ranges():
+    starts, ends = pixels_to_ranges([5, 4, 6, 100], 2)
+    np.testing.assert_array_equal(starts, [64, 1600])
+    np.testing.assert_array_equal(ends, [112, 1616])
+    x = np.arange(2000)
+    np.testing.assert_array_equal(in_ranges(x, starts, ends),
+                                  ((x >= 64) & (x < 112)) |
+                                  ((x >= 1600) & (x < 1616)))
+    starts, ends = merge_ranges([5, 0, 3, 20], [8, 3, 4, 21])
+    np.testing.assert_array_equal(starts, [0, 5, 20])
+    np.testing.assert_array_equal(ends, [4, 8, 21])
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+from tdd.photometry import PhotTables
+from tdd.partitioned import PartitionedPhotTables, partition_index
+from tdd.aggregates import SummaryState, CoaddState
+from tdd.shuffle import shuffle_to_object_major
+from tdd.lightcurve import LightCurve
+
+
+def test_partitioned_phottables(tmpdir, plasticc_phot):
+    phot = plasticc_phot
+    phot.loc[::40, 'fluxerr'] = np.nan
+    inMemory = PhotTables(phot.copy())
+
+    chunks = list(phot.iloc[i: i + 1000] for i in range(0, len(phot), 1000))
+    partitioned = PartitionedPhotTables.fromChunks(chunks, str(tmpdir),
+                                                   numPartitions=4, nproc=2)
+
+    pd.testing.assert_frame_equal(inMemory.coaddedTable(timeStep=2.),
+                                  partitioned.coaddedTable(timeStep=2.),
+                                  check_dtype=False)
+    pd.testing.assert_frame_equal(inMemory.summary(), partitioned.summary(),
+                                  check_dtype=False, check_names=False)
+
+
+def test_merged_aggregate_states(plasticc_phot):
+    rng = np.random.RandomState(0)
+    phot = plasticc_phot
+    # kept columns varying within coadds, with missing values
+    phot['tileID'] = rng.randint(0, 100, size=len(phot))
+    phot['fieldID'] = phot.fieldID.astype(float)
+    phot.loc[phot.index[::3], 'fieldID'] = np.nan
+    photTable = PhotTables(phot)
+    lcs = photTable.lcs
+    parts = rng.randint(0, 5, size=len(lcs))
+
+    summaryStates = list(SummaryState.fromFrame(lcs[parts == i], SNRmin=0.)
+                         for i in range(5))
+    pd.testing.assert_frame_equal(
+        SummaryState.mergeAll(summaryStates).finalize(),
+        LightCurve.summarize(lcs, SNRmin=0.), check_dtype=False)
+
+    coaddStates = list(CoaddState.fromFrame(lcs[parts == i], timeStep=2.)
+                       for i in range(5))
+    pd.testing.assert_frame_equal(CoaddState.mergeAll(coaddStates).finalize(),
+                                  photTable.coaddedTable(timeStep=2.),
+                                  check_dtype=False)
+
+
+def test_shuffle_to_object_major(tmpdir, plasticc_phot):
+    phot = plasticc_phot
+    pointingOrder = phot.sort_values('mjd').reset_index(drop=True)
+    batches = (pointingOrder.iloc[i: i + 500]
+               for i in range(0, len(pointingOrder), 500))
+    store = shuffle_to_object_major(batches, str(tmpdir), numPartitions=3)
+
+    numRows = 0
+    for i in range(store.numPartitions):
+        part = store.partition(i)
+        numRows += len(part)
+        assert np.all(np.diff(part.snid.values) >= 0)
+        sameObject = part.snid.values[1:] == part.snid.values[:-1]
+        assert np.all(np.diff(part.mjd.values)[sameObject] >= 0)
+    assert numRows == len(phot)
+
+
+def test_partition_index():
+    snid = 4 * np.arange(1000)
+    parts = partition_index(snid, 4)
+    assert set(parts) == set(range(4))
+    assert np.bincount(parts).min() > 150
+    np.testing.assert_array_equal(parts,
+                                  partition_index(snid.astype(np.int32), 4))
+
+
+def test_partitions_written_twice(tmpdir, plasticc_phot):
+    phot = plasticc_phot
+    directory = str(tmpdir)
+    PartitionedPhotTables.fromDataFrame(phot, directory, numPartitions=4)
+    with pytest.raises(ValueError):
+        PartitionedPhotTables.fromDataFrame(phot, directory, numPartitions=3)
+    half = phot[phot.snid < phot.snid.median()]
+    store = PartitionedPhotTables.fromDataFrame(half, directory,
+                                                numPartitions=3,
+                                                overwrite=True)
+    assert store.metadata['numRows'] == len(half)
+    assert sum(len(store.partition(i)) for i in range(3)) == len(half)
+    pd.testing.assert_frame_equal(store.summary(),
+                                  PhotTables(half.copy()).summary(),
+                                  check_dtype=False, check_names=False)
+
+    with pytest.raises(ValueError):
+        shuffle_to_object_major((phot,), directory, numPartitions=3)
+    store = shuffle_to_object_major((phot,), directory, numPartitions=3,
+                                    overwrite=True)
+    assert sum(len(store.partition(i)) for i in range(3)) == len(phot)
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+from tdd.photometry import Photometry
+
+
+def _photometry(numObjects, firstSNID=0, numObs=10, seed=0):
+    rng = np.random.RandomState(seed)
+    numRows = numObjects * numObs
+    return pd.DataFrame(dict(snid=np.repeat(np.arange(firstSNID,
+                                                      firstSNID + numObjects),
+                                            numObs),
+                             obsHistID=rng.randint(1, 100000, size=numRows),
+                             band=rng.choice(['lsstg', 'lsstr'], size=numRows),
+                             flux=rng.normal(size=numRows)))
+
+
+def test_photometry_append():
+    batches = list(_photometry(3, firstSNID=3 * i, seed=i) for i in range(50))
+    phot = Photometry(batches[0])
+    for (i, batch) in enumerate(batches[1:]):
+        phot.append(batch, recalculatePPID=(i % 10 == 0))
+
+    expected = pd.concat(batches, ignore_index=True)
+    lc = phot.lightCurve
+    assert len(phot) == len(expected)
+    for col in expected.columns:
+        np.testing.assert_array_equal(lc[col].values, expected[col].values)
+    np.testing.assert_array_equal(lc.PPID.values,
+                                  Photometry.pair_method(expected.obsHistID,
+                                                         expected.snid,
+                                                         phot.maxObsHistID))
+
+
+def test_ppid_index_lookups():
+    df = _photometry(100, numObs=20)
+    index = Photometry(df).ppidIndex
+
+    snids = np.array([5, 99, 1000])
+    rows, offsets = index.rowsForSNID(snids)
+    for (i, snid) in enumerate(snids):
+        np.testing.assert_array_equal(np.sort(rows[offsets[i]:offsets[i + 1]]),
+                                      np.flatnonzero(df.snid.values == snid))
+
+    obsHistIDs = df.obsHistID.values[[3, 7]]
+    rows, offsets = index.rowsForObsHistID(obsHistIDs)
+    for (i, obsHistID) in enumerate(obsHistIDs):
+        np.testing.assert_array_equal(
+            np.sort(rows[offsets[i]:offsets[i + 1]]),
+            np.flatnonzero(df.obsHistID.values == obsHistID))
+
+    rows, offsets = index.rowsForPairs(df.snid.values[[10, 20]],
+                                       df.obsHistID.values[[10, 20]])
+    assert 10 in rows[offsets[0]:offsets[1]]
+    assert 20 in rows[offsets[1]:offsets[2]]
+
+
+def test_stat_table():
+    df = _photometry(50, numObs=12)
+    df['SNR'] = df.flux * 10.
+    df.loc[df.index[::9], 'flux'] = np.nan
+    props = ('flux', 'SNR', 'obsHistID')
+    funcs = (np.max, np.mean, len)
+
+    table = Photometry.statTable(props, funcs, dataframe=df,
+                                 groupTuple=('snid', 'band'))
+
+    grouped = df.groupby(['snid', 'band'])
+    expected = grouped.agg(dict(zip(props, funcs)))
+    expected.columns = list('_'.join((func.__name__, prop))
+                            for (prop, func) in zip(props, funcs))
+    expected = expected.reset_index().pivot_table(index='snid',
+                                                  columns='band')
+    expected.columns = ['_'.join(col) for col in expected.columns.values]
+    assert list(table.columns) == list(expected.columns)
+    np.testing.assert_allclose(table.values, expected.values)
+
+
+def test_stat_table_reductions():
+    df = _photometry(50, numObs=12)
+    df['SNR'] = df.flux * 10.
+    df.loc[df.index[::9], 'flux'] = np.nan
+
+    def mean(x):
+        return x.max() + 1.
+    props = ('flux', 'SNR', 'obsHistID')
+    for funcs in ((pd.Series.std, np.std, mean),
+                  (np.std, pd.Series.mean, max)):
+        table = Photometry.statTable(props, funcs, dataframe=df,
+                                     groupTuple=('snid', 'band'))
+        expected = Photometry.statTable(props, funcs,
+                                        grouped=df.groupby(['snid', 'band']))
+        assert list(table.columns) == list(expected.columns)
+        np.testing.assert_allclose(table.values, expected.values.astype(float))
+
+
+def test_group_index():
+    from tdd.grouping import GroupIndex
+    phot = Photometry(_photometry(numObjects=50, numObs=40, seed=3))
+    lcs = phot.lightCurve.copy()
+    lcs.loc[::17, 'band'] = None
+    groupIndex = GroupIndex.fromFrame(lcs, ('snid', 'band'))
+    grouped = lcs.groupby(['snid', 'band'], sort=True)
+    assert groupIndex.numGroups == grouped.ngroups
+    assert (groupIndex.codes == grouped.ngroup().fillna(-1).values).all()
+    assert groupIndex.index.equals(grouped.size().index)
+    np.testing.assert_array_equal(groupIndex.sizes, grouped.size().values)
+    np.testing.assert_allclose(groupIndex.reduce(np.maximum, lcs.obsHistID.values),
+                               grouped.obsHistID.max().values)
+    np.testing.assert_allclose(groupIndex.sum(lcs.flux.values),
+                               grouped.flux.sum().values)
+
+    stats = Photometry.statTable(('obsHistID', 'flux'), (np.max, np.mean),
+                                 dataframe=phot.lightCurve,
+                                 groupIndex=phot.groupIndex())
+    pd.testing.assert_frame_equal(
+        stats, Photometry.statTable(('obsHistID', 'flux'), (np.max, np.mean),
+                                    dataframe=phot.lightCurve,
+                                    groupTuple=('snid', 'band')))
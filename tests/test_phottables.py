@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+from tdd.photometry import PhotTables
+
+
+def test_phottables_without_copies(plasticc_phot):
+    phot = plasticc_phot
+    phot.loc[::50, 'fluxerr'] = np.nan
+    phot['sky'] = np.abs(phot.flux)
+
+    copied = PhotTables(phot.copy())
+    owned = PhotTables(phot, copy=False)
+    assert owned.lcs is phot
+    assert not phot.fluxerr.isnull().any()
+
+    for (timeStep, timeOffset) in ((1.0, 0.), (3.0, 0.3)):
+        pd.testing.assert_frame_equal(
+            copied.coaddedTable(timeStep=timeStep, timeOffset=timeOffset),
+            owned.coaddedTable(timeStep=timeStep, timeOffset=timeOffset),
+            check_dtype=False)
+    avg_cols = ('mjd', 'flux', 'sky')
+    coadd = copied.coaddedTable(avg_cols=avg_cols)
+    assert 'coadd_sky' in coadd.columns and 'coadd_zp' not in coadd.columns
+    pd.testing.assert_frame_equal(coadd, owned.coaddedTable(avg_cols=avg_cols),
+                                  check_dtype=False)
+    # indexes by night depend on the time step and are not kept
+    assert all('night' not in keys for keys in owned._groupIndices)
+
+
+def test_phottables_memoized_results(plasticc_phot):
+    phot = plasticc_phot
+    photTable = PhotTables(phot, cacheEntries=4)
+
+    coadd = photTable.coaddedTable(timeStep=2.0)
+    assert photTable.coaddedTable(timeStep=2.0) is coadd
+    summary = photTable.summary()
+    assert photTable.summary() is summary
+    stats = photTable.cacheStats
+    assert stats['hits'] == 2
+    assert stats['entries'] == 3
+
+    photTable.markModified()
+    assert photTable.cacheStats['entries'] == 0
+    pd.testing.assert_frame_equal(photTable.summary(), summary)
+
+
+def test_lazy_pipeline(plasticc_phot):
+    from tdd.lightcurve import LightCurve
+    phot = plasticc_phot
+    phot.loc[::30, 'fluxerr'] = np.nan
+    photTable = PhotTables(phot, sanitize_nans=False)
+
+    lcs = LightCurve.sanitize_nan(photTable.lcs)
+    lcs = lcs[lcs.flux / lcs.fluxerr > 1.]
+    lcs = LightCurve.discretize_time(lcs, timeStep=2.)
+    lcs = LightCurve.add_weightedColumns(lcs, copy=True)
+    coadd = LightCurve.coaddpreprocessed(lcs.copy(), include_snid=True,
+                                         additionalColsKept=('tileID',),
+                                         additionalAggFuncs='first')
+
+    plan = photTable.lazy(objectsPerChunk=3).sanitize_nan().filter_snr(1.)\
+        .discretize_time(timeStep=2.).add_weightedColumns()
+    pd.testing.assert_frame_equal(plan.collect(), lcs, check_dtype=False)
+    plan = plan.coadd(additionalColsKept=('tileID',))
+    pd.testing.assert_frame_equal(plan.collect(), coadd, check_dtype=False)
+    plan = plan.summarize()
+    assert 'fieldID' not in plan.explain()
+    pd.testing.assert_frame_equal(plan.collect(),
+                                  LightCurve.summarize(coadd),
+                                  check_dtype=False)
+
+    # averaged columns other than the standard ones are read
+    phot['sky'] = np.abs(phot.flux)
+    avg_cols = ('mjd', 'flux', 'fluxerr', 'zp', 'sky')
+    lcs = LightCurve.discretize_time(LightCurve.sanitize_nan(phot))
+    lcs = LightCurve.add_weightedColumns(lcs, avg_cols=avg_cols, copy=True)
+    plan = PhotTables(phot).lazy(objectsPerChunk=3).discretize_time()\
+        .add_weightedColumns(avg_cols=avg_cols).coadd()
+    pd.testing.assert_frame_equal(
+        plan.collect(), LightCurve.coaddpreprocessed(lcs, include_snid=True),
+        check_dtype=False)
+
+
+def test_phottables_memory_budget(plasticc_phot):
+    from tdd.memory import set_memory_budget, parse_memory_size
+    assert parse_memory_size('1.5GiB') == 3 * 2**29
+    assert parse_memory_size('8GB') == 8 * 10**9
+    phot = plasticc_phot
+    phot = phot[~((phot.snid < phot.snid.median()) & (phot.band == 'lsstu'))]
+    phot['sky'] = np.abs(phot.flux)
+    avg_cols = ('mjd', 'flux', 'fluxerr', 'sky')
+    photTable = PhotTables(phot.copy())
+    summary = photTable.summary()
+    coadd = photTable.coaddedTable()
+    coaddSky = photTable.coaddedTable(avg_cols=avg_cols)
+
+    set_memory_budget('100kB')
+    try:
+        photTable = PhotTables(phot.copy())
+        assert len(photTable._budgetedChunks('summary')) > 1
+        assert len(photTable._budgetedChunks('coaddedTable')) > 1
+        pd.testing.assert_frame_equal(photTable.summary(), summary)
+        pd.testing.assert_frame_equal(photTable.coaddedTable(), coadd)
+        pd.testing.assert_frame_equal(
+            photTable.coaddedTable(avg_cols=avg_cols), coaddSky)
+    finally:
+        set_memory_budget(None)
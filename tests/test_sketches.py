@@ -0,0 +1,28 @@
+import numpy as np
+from tdd.sketches import KLLSketch, QuantileSketches
+
+
+def test_quantile_sketches(plasticc_metadata, plasticc_phot):
+    rng = np.random.RandomState(0)
+    values = rng.lognormal(size=200000)
+    q = np.linspace(0., 1., 21)
+    sketches = list(KLLSketch(k=200, seed=i).update(chunk)
+                    for (i, chunk) in enumerate(np.array_split(values, 8)))
+    sketch = sketches[0]
+    for other in sketches[1:]:
+        sketch.merge(other)
+    assert sketch.count == len(values)
+    assert sketch.numRetained < 3 * 200
+    ranks = np.searchsorted(np.sort(values), sketch.quantile(q)) / len(values)
+    assert np.abs(ranks - q).max() < 0.02
+
+    metadata, phot = plasticc_metadata, plasticc_phot
+    sketches = QuantileSketches(by=('band', 'tclass'), seed=0)
+    for rows in np.array_split(np.arange(len(phot)), 3):
+        sketches.update(phot.iloc[rows], metadata=metadata)
+    quantiles = sketches.quantiles((0., 0.5, 1.))
+    exact = phot.join(metadata.tclass, on='snid').groupby(['band', 'tclass'])
+    np.testing.assert_allclose(quantiles.xs(1., level='quantile').flux,
+                               exact.flux.max().values)
+    np.testing.assert_allclose(quantiles.xs(0., level='quantile').fluxerr,
+                               exact.fluxerr.min().values)